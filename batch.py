@@ -0,0 +1,162 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from datetime import datetime
+from typing import Any, Dict, List
+
+from main import create_initial_state
+from workflow import create_research_paper_workflow
+from export import export_report
+from clients import TokenBucket
+from scheduler import close_browser_pool
+from checkpoint import RUNS_DIR, new_run_id, run_config
+from instrumentation import trace_run
+from context import load_encoding
+
+def read_topics(path: str) -> List[Dict[str, str]]:
+    """Read topics from a file, or stdin when path is "-".
+
+    Each line is either a JSON object with a "topic" (and optional "id") or a plain topic.
+    Blank lines and lines starting with # are ignored.
+    """
+    stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        jobs = []
+        seen_ids = set()
+        for line in stream:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                entry = json.loads(line)
+                topic = entry["topic"]
+                job_id = str(entry.get("id", topic))
+            else:
+                topic = job_id = line
+            if job_id not in seen_ids:
+                seen_ids.add(job_id)
+                jobs.append({"id": job_id, "topic": topic})
+        return jobs
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+def latest_records(output_path: str) -> Dict[str, Dict[str, Any]]:
+    """Return the latest record of every id in the output file"""
+    records = {}
+    if os.path.exists(output_path):
+        with open(output_path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    records[record["id"]] = record
+    return records
+
+async def run_topic(job: Dict[str, str], research_workflow, semaphore: asyncio.Semaphore,
+                    limiter: TokenBucket) -> Dict[str, Any]:
+    """Generate one paper and return its result record.
+
+    A job carrying the run_id of an earlier failed attempt resumes that run from
+    its last completed step.
+    """
+    async with semaphore:
+        await asyncio.sleep(limiter.reserve())
+        run_id = job.get("run_id")
+        start = time.monotonic()
+        record = {"id": job["id"], "topic": job["topic"], "run_id": run_id}
+        result = None
+        trace = None
+        try:
+            # A stored run that cannot be read fails this topic only, like any other error
+            workflow_input = None
+            if run_id is None or not (await research_workflow.aget_state(run_config(run_id))).values:
+                run_id = new_run_id()
+                workflow_input = create_initial_state(job["topic"])
+                print(f"Starting research paper generation on: {job['topic']} (run {run_id})")
+            else:
+                print(f"Resuming run {run_id} on: {job['topic']}")
+            record["run_id"] = run_id
+            with trace_run(run_id) as trace:
+                result = await research_workflow.ainvoke(workflow_input, run_config(run_id))
+        except Exception as e:
+            print(f"An error occurred for topic {job['topic']!r}: {type(e).__name__}: {str(e)}")
+            record.update({"status": "error", "error": f"{type(e).__name__}: {str(e)}"})
+    
+    # Export outside the semaphore so the next topic starts while this one renders
+    if result is not None:
+        exports = await export_report(result, run_id=run_id)
+        failed = [fmt for fmt, status in exports.items() if status["status"] != "ok"]
+        record.update({
+            "status": "ok" if not failed else "error",
+            "exports": exports,
+            "pdf": exports.get("pdf", {}).get("path"),
+            "outline": result["outline"],
+            "draft": result["draft"],
+            "sources": result["sources"],
+        })
+        if failed:
+            record["error"] = "; ".join(f"{fmt}: {exports[fmt]['error']}" for fmt in failed)
+    if trace is not None:
+        record["report"] = trace.write(os.path.join(RUNS_DIR, run_id))
+        record["peak_rss_mb"] = trace.report()["peak_rss_mb"]
+    record["duration_seconds"] = round(time.monotonic() - start, 2)
+    record["finished_at"] = datetime.now().isoformat(timespec="seconds")
+    return record
+
+async def run_batch(topics_path: str, output_path: str, concurrency: int = 2,
+                    topics_per_minute: float = 0) -> List[Dict[str, Any]]:
+    """Generate a paper for every topic not yet completed in output_path.
+
+    All papers share one compiled workflow, the module-level LLM clients and the
+    browser pool of this event loop. Records are appended to output_path as each
+    paper finishes, so rerunning the batch retries only the failed topics, each
+    resuming from the last step its previous attempt completed.
+    """
+    jobs = read_topics(topics_path)
+    previous_records = latest_records(output_path)
+    pending_jobs = []
+    for job in jobs:
+        previous = previous_records.get(job["id"])
+        if previous is None:
+            pending_jobs.append(job)
+        elif previous["status"] != "ok":
+            pending_jobs.append({**job, "run_id": previous.get("run_id")})
+    print(f"{len(pending_jobs)} topic(s) to run, {len(jobs) - len(pending_jobs)} already completed")
+
+    # Load the tokenizer once for every paper, without blocking the event loop
+    await asyncio.to_thread(load_encoding)
+    research_workflow = create_research_paper_workflow()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    # A capacity of one spaces the topics evenly instead of starting several at once
+    limiter = TokenBucket(topics_per_minute, capacity=1)
+
+    records = []
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(output_dir, exist_ok=True)
+    try:
+        with open(output_path, "a", encoding="utf-8") as output:
+            tasks = [run_topic(job, research_workflow, semaphore, limiter) for job in pending_jobs]
+            for finished in asyncio.as_completed(tasks):
+                record = await finished
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+                records.append(record)
+    finally:
+        await close_browser_pool()
+
+    failed = sum(1 for record in records if record["status"] != "ok")
+    print(f"\nBatch complete: {len(records) - failed} succeeded, {failed} failed. Results in {output_path}")
+    return records
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate research papers for many topics in one process")
+    parser.add_argument("topics", help='file with one topic or JSON object per line, or "-" for stdin')
+    parser.add_argument("-o", "--output", default="batch_results.jsonl", help="JSONL file receiving one record per topic")
+    parser.add_argument("-c", "--concurrency", type=int, default=2, help="papers generated at the same time")
+    parser.add_argument("--topics-per-minute", type=float, default=0, help="limit on paper starts per minute (0 for no limit)")
+    args = parser.parse_args()
+
+    asyncio.run(run_batch(args.topics, args.output, args.concurrency, args.topics_per_minute))
@@ -0,0 +1,283 @@
+"""Micro-benchmarks for the CPU-bound parts of the pipeline.
+
+Run `python benchmark.py <name>`; see `python benchmark.py --help` for the list.
+"""
+import time
+import random
+import argparse
+import unicodedata
+
+from synthetic import synthetic_text, synthetic_draft
+
+def bench_context(chunks: int = 5000, repeat: int = 3) -> None:
+    """Time build_context on research results totalling about `chunks` chunks"""
+    from context import build_context, split_chunks, CHUNK_CHARS
+
+    rng = random.Random(0)
+    results = []
+    # Each result is roughly three chunks long
+    for i in range(max(1, chunks // 3)):
+        results.append({"url": f"https://example.com/{i}", "content": synthetic_text(CHUNK_CHARS * 3 // 9, rng)})
+    chunk_count = sum(len(split_chunks(result["content"])) for result in results)
+    query = "diffusion model sampling guidance"
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        context = build_context(results, query, 2000)
+        timings.append(time.perf_counter() - start)
+    print(f"build_context: {len(results)} results ({chunk_count} chunks) -> {len(context)} chars, "
+          f"best {min(timings) * 1000:.1f} ms over {repeat} runs")
+
+def _chained_normalize_text(text: str) -> str:
+    """The original chained-replace normalize_text, kept as the speed and output baseline"""
+    if not text:
+        return ""
+    replacements = {
+        '\u2014': '--', '\u2013': '-', '\u2018': "'", '\u2019': "'", '\u201c': '"',
+        '\u201d': '"', '\u2022': '*', '\u2026': '...', '\u00a0': ' ',
+    }
+    for unicode_char, ascii_char in replacements.items():
+        text = text.replace(unicode_char, ascii_char)
+    return ''.join(c if ord(c) < 128 else unicodedata.normalize('NFKD', c).encode('ascii', 'ignore').decode('ascii', 'ignore') for c in text)
+
+def bench_normalize(megabytes: float = 4, repeat: int = 3) -> None:
+    """Time normalize_text against the chained-replace baseline on a multi-megabyte draft"""
+    from pdf_generator import normalize_text
+
+    rng = random.Random(0)
+    # Mostly English prose with typographic punctuation, math symbols and non-Latin words mixed in
+    extras = ["\u2014", "\u201cquoted\u201d", "\u2026", "\u00e9t\u00e9", "\u03b1\u03b2\u03b3", "\u2211\u221a\u2264",
+              "\u6a21\u578b", "\u0434\u0438\u0444\u0444\u0443\u0437\u0438\u044f", "\ufb01ne", "x\u00b2"]
+    pieces = []
+    size = 0
+    while size < megabytes * 1_000_000:
+        piece = synthetic_text(30, rng) + " " + rng.choice(extras) + " "
+        pieces.append(piece)
+        size += len(piece)
+    text = "".join(pieces)
+
+    for name, function in (("baseline", _chained_normalize_text), ("normalize_text", normalize_text)):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            output = function(text)
+            timings.append(time.perf_counter() - start)
+        print(f"{name}: {len(text) / 1e6:.1f}M chars, best {min(timings) * 1000:.1f} ms over {repeat} runs")
+    assert output == _chained_normalize_text(text), "normalize_text output differs from the baseline"
+
+def bench_render(pages: int = 200) -> None:
+    """Time laying out and writing the PDF of a synthetic paper of about `pages` pages"""
+    import os
+    import tempfile
+    from pdf_generator import build_report_pdf
+
+    rng = random.Random(0)
+    result = {
+        "topic": "Synthetic Paper",
+        "outline": "\n".join(f"{i + 1}. {synthetic_text(6, rng)}" for i in range(20)),
+        "draft": synthetic_draft(pages, rng),
+        "sources": [f"https://example.com/{i}" for i in range(20)],
+    }
+    start = time.perf_counter()
+    pdf = build_report_pdf(result, "2025-01-01")
+    layout_seconds = time.perf_counter() - start
+    with tempfile.TemporaryDirectory() as directory:
+        pdf.output(os.path.join(directory, "paper.pdf"))
+    total_seconds = time.perf_counter() - start
+    print(f"render: {len(result['draft']) / 1e6:.2f}M chars -> {pdf.page_no()} pages, "
+          f"layout {layout_seconds:.2f} s, total {total_seconds:.2f} s")
+
+async def _stub_provider(port: int, failure_rate: float, rng: random.Random):
+    """Local OpenAI-compatible chat endpoint answering a share of requests with 429 or 503"""
+    from aiohttp import web
+
+    async def chat(request):
+        if rng.random() < failure_rate:
+            status = rng.choice((429, 503))
+            return web.json_response({"error": {"message": "stub failure"}}, status=status, headers={"retry-after": "0"})
+        return web.json_response({
+            "id": "stub", "object": "chat.completion", "created": 0, "model": "stub",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 1, "total_tokens": 11},
+        })
+
+    app = web.Application()
+    app.router.add_post("/openai/v1/chat/completions", chat)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+def bench_clients(calls: int = 200, failure_rate: float = 0.3, port: int = 18765) -> None:
+    """Send concurrent model calls through the Groq client layer to a flaky local stub server"""
+    import os
+    import asyncio
+    os.environ.setdefault("GROQ_API_KEY", "stub")
+    os.environ.setdefault("RETRY_BASE_DELAY", "0.01")
+    from clients import groq_chat_model, groq_gate
+    from instrumentation import trace_run, span
+
+    async def run():
+        runner = await _stub_provider(port, failure_rate, random.Random(0))
+        model = groq_chat_model(model="stub", base_url=f"http://127.0.0.1:{port}")
+
+        async def one_call(i):
+            with span("llm", "llm") as attrs:
+                try:
+                    await model.ainvoke(f"prompt {i}")
+                    return True, attrs.get("retries") or 0
+                except Exception:
+                    return False, attrs.get("retries") or 0
+
+        try:
+            with trace_run("bench"):
+                start = time.perf_counter()
+                outcomes = await asyncio.gather(*(one_call(i) for i in range(calls)))
+                seconds = time.perf_counter() - start
+        finally:
+            await runner.cleanup()
+        succeeded = sum(1 for ok, _ in outcomes if ok)
+        retries = sum(r for _, r in outcomes)
+        print(f"clients: {calls} calls, {failure_rate:.0%} failing -> {succeeded} succeeded, {retries} retries, "
+              f"{seconds:.2f} s, circuit {groq_gate.breaker.state}")
+
+    asyncio.run(run())
+
+def bench_knowledge(chunks: int = 1_000_000, lookups: int = 200) -> None:
+    """Time knowledge base lookups once it holds `chunks` chunks of text over a large vocabulary"""
+    import os
+    import tempfile
+    from knowledge import KnowledgeBase
+
+    rng = random.Random(0)
+    syllables = ["ka", "lo", "mi", "ne", "ru", "ta", "vo", "shi", "dra", "pel", "tor", "qua"]
+    # Zipf-like word frequencies, as in real text
+    vocabulary = list({"".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))) for _ in range(30000)})
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+
+    def text(words: int) -> str:
+        return " ".join(rng.choices(vocabulary, weights, k=words))
+
+    with tempfile.TemporaryDirectory() as directory:
+        knowledge_base = KnowledgeBase(os.path.join(directory, "knowledge.sqlite3"))
+        start = time.perf_counter()
+        # Each result holds ten paragraphs of about one chunk each
+        for batch in range(0, chunks, 10000):
+            knowledge_base.add_results([{"url": f"https://example.com/{batch + i}", "content": "\n\n".join(
+                text(50) for _ in range(10))} for i in range(0, min(10000, chunks - batch), 10)], "bench")
+        build_seconds = time.perf_counter() - start
+        count = knowledge_base.stats()["chunks"]
+        timings = []
+        for _ in range(lookups):
+            query = text(rng.randint(3, 6))
+            start = time.perf_counter()
+            knowledge_base.lookup(query)
+            timings.append(time.perf_counter() - start)
+        print(f"knowledge: {count} chunks indexed in {build_seconds:.1f} s "
+              f"({os.path.getsize(knowledge_base.path) / 1e6:.0f} MB); lookup p50 {_percentile(timings, 0.5) * 1000:.1f} ms, "
+              f"p99 {_percentile(timings, 0.99) * 1000:.1f} ms over {lookups} queries")
+
+def _percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+def run_e2e(topics: int, **mock_options) -> dict:
+    """Write `topics` papers concurrently against the local mock providers and measure the run.
+
+    Every paper goes through the full workflow graph and is exported as a PDF.
+    Prints and returns papers per hour, per-node latency percentiles and peak memory.
+    """
+    import json
+    import asyncio
+    import tempfile
+    from langgraph.checkpoint.memory import InMemorySaver
+
+    import mocks
+    mocks.install(**mock_options)
+    from main import create_initial_state
+    from workflow import create_research_paper_workflow
+    from export import export_report
+    from scheduler import close_browser_pool
+    from instrumentation import trace_run, span, peak_rss_mb
+
+    async def one_paper(app, i, directory):
+        topic = f"Synthetic topic {i}: {synthetic_text(6, random.Random(i))}"
+        config = {"configurable": {"thread_id": f"bench-{i}"}}
+        with trace_run(f"bench-{i}") as trace:
+            result = await app.ainvoke(create_initial_state(topic), config)
+            with span("export", "export"):
+                statuses = await export_report(result, ["pdf"], directory, f"bench-{i}")
+        assert statuses["pdf"]["status"] == "ok", statuses
+        return trace.report()
+
+    async def run():
+        app = create_research_paper_workflow(checkpointer=InMemorySaver())
+        with tempfile.TemporaryDirectory() as directory:
+            try:
+                start = time.perf_counter()
+                reports = await asyncio.gather(*(one_paper(app, i, directory) for i in range(topics)))
+                return reports, time.perf_counter() - start
+            finally:
+                await close_browser_pool()
+
+    reports, seconds = asyncio.run(run())
+    durations = {}
+    for report in reports:
+        for s in report["spans"]:
+            if s["category"] in ("node", "export"):
+                durations.setdefault(s["name"], []).append(s["duration"])
+    summary = {
+        "topics": topics,
+        "seconds": round(seconds, 2),
+        "papers_per_hour": round(topics * 3600 / seconds, 1),
+        "nodes": {name: {f"p{int(q * 100)}": round(_percentile(values, q), 3) for q in (0.5, 0.9, 0.99)}
+                  for name, values in durations.items()},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    print(json.dumps(summary))
+    return summary
+
+def bench_e2e(concurrency=(1, 10, 100)) -> None:
+    """End-to-end throughput with mock providers, one fresh process per concurrency level"""
+    import os
+    import sys
+    import json
+    import tempfile
+    import subprocess
+
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for topics in concurrency:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            # Empty caches and no rate limits, so every paper does all of its (simulated) work;
+            # browser_use telemetry is off so it sends nothing and logs nothing after the summary
+            env = {**os.environ, "OPENPAPER_CACHE_DIR": cache_dir, "LLM_CACHE_BYPASS": "1",
+                   "SEARCH_CACHE_BYPASS": "1", "GROQ_REQUESTS_PER_MINUTE": "0", "TAVILY_REQUESTS_PER_MINUTE": "0",
+                   "ANONYMIZED_TELEMETRY": "false",
+                   # The mock text covers every research aspect, so the quality gate would skip every browser task
+                   "QUALITY_STRONG": "2"}
+            completed = subprocess.run([sys.executable, "-c", f"import benchmark; benchmark.run_e2e({topics})"],
+                                       cwd=directory, env=env, capture_output=True, text=True, check=True)
+        summary = json.loads([line for line in completed.stdout.splitlines() if line.startswith("{")][-1])
+        nodes = ", ".join(f"{name} p50 {t['p50']:.2f}/p90 {t['p90']:.2f}/p99 {t['p99']:.2f} s"
+                          for name, t in summary["nodes"].items())
+        print(f"e2e: {topics} topics in {summary['seconds']:.1f} s -> {summary['papers_per_hour']:.0f} papers/hour, "
+              f"peak {summary['peak_rss_mb']:.0f} MB; {nodes}")
+
+BENCHMARKS = {
+    "context": bench_context,
+    "normalize": bench_normalize,
+    "render": bench_render,
+    "clients": bench_clients,
+    "e2e": bench_e2e,
+    "knowledge": bench_knowledge,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("name", choices=sorted(BENCHMARKS) + ["all"], help="benchmark to run")
+    args = parser.parse_args()
+
+    for name, bench in BENCHMARKS.items():
+        if args.name in (name, "all"):
+            bench()
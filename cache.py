@@ -0,0 +1,312 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+from instrumentation import span, record_usage
+
+if TYPE_CHECKING:
+    # langchain_core is slow to import, so message classes are only loaded when a model is used
+    from langchain_core.messages import AIMessage
+
+# Directory holding the on-disk caches
+CACHE_DIR = os.getenv("OPENPAPER_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".openpaper"))
+# Seconds before a cached LLM response expires
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+# Maximum number of cached LLM responses; least recently used entries are evicted first
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+# Set to 1 to always call the model (responses are still written to the cache)
+LLM_CACHE_BYPASS = os.getenv("LLM_CACHE_BYPASS", "").lower() in ("1", "true", "yes")
+
+class LLMCache:
+    """SQLite-backed key/value store for LLM responses with TTL expiry and LRU eviction"""
+
+    def __init__(self, path: str, ttl: float = LLM_CACHE_TTL, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value for key, or None if it is missing or expired"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, value: str) -> None:
+        """Store value under key and evict the least recently used entries beyond max_entries"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                "SELECT key FROM llm_cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        """Remove every cached entry"""
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the current number of entries"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+_llm_cache = None
+
+def get_llm_cache() -> LLMCache:
+    """Return the process-wide LLM cache, creating it on first use"""
+    global _llm_cache
+    if _llm_cache is None:
+        _llm_cache = LLMCache(os.path.join(CACHE_DIR, "llm_cache.sqlite3"))
+    return _llm_cache
+
+class CachedChatModel:
+    """Wrap a chat model so repeated prompts are answered from the on-disk cache.
+
+    Only invoke/ainvoke/astream are cached; every other attribute is forwarded to the wrapped model.
+    """
+
+    def __init__(self, model, cache: Optional[LLMCache] = None, bypass: Optional[bool] = None):
+        self.model = model
+        self._cache = cache
+        self.bypass = LLM_CACHE_BYPASS if bypass is None else bypass
+
+    @property
+    def cache(self) -> LLMCache:
+        if self._cache is None:
+            self._cache = get_llm_cache()
+        return self._cache
+
+    def bypassing(self) -> "CachedChatModel":
+        """The same model and cache, skipping lookups but still storing every new response"""
+        return CachedChatModel(self.model, self._cache, bypass=True)
+
+    def cache_key(self, input: Any, **kwargs: Any) -> str:
+        """Hash the model identity, its parameters and the prompt into a cache key"""
+        from langchain_core.load import dumpd
+        
+        identity = {
+            "model": getattr(self.model, "_llm_type", type(self.model).__name__),
+            "params": getattr(self.model, "_identifying_params", {}),
+            "input": input if isinstance(input, str) else dumpd(input),
+            "kwargs": kwargs,
+        }
+        payload = json.dumps(identity, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _lookup(self, key: str) -> Optional["AIMessage"]:
+        from langchain_core.messages import AIMessage
+        
+        if self.bypass:
+            return None
+        cached = self.cache.get(key)
+        if cached is None:
+            return None
+        return AIMessage(content=json.loads(cached)["content"], response_metadata={"cache_hit": True})
+
+    def _store(self, key: str, result: Any) -> None:
+        content = result.content if hasattr(result, 'content') else str(result)
+        self.cache.put(key, json.dumps({"content": content}))
+
+    def _model_name(self) -> str:
+        return getattr(self.model, "model_name", type(self.model).__name__)
+
+    def invoke(self, input: Any, config: Any = None, **kwargs: Any) -> Any:
+        with span("llm", "llm", model=self._model_name()) as attrs:
+            key = self.cache_key(input, **kwargs)
+            cached = self._lookup(key)
+            attrs["cache_hit"] = cached is not None
+            if cached is not None:
+                return cached
+            result = self.model.invoke(input, config, **kwargs)
+            record_usage(attrs, result)
+            self._store(key, result)
+            return result
+
+    async def ainvoke(self, input: Any, config: Any = None, **kwargs: Any) -> Any:
+        with span("llm", "llm", model=self._model_name()) as attrs:
+            key = self.cache_key(input, **kwargs)
+            cached = self._lookup(key)
+            attrs["cache_hit"] = cached is not None
+            if cached is not None:
+                return cached
+            result = await self.model.ainvoke(input, config, **kwargs)
+            record_usage(attrs, result)
+            self._store(key, result)
+            return result
+
+    async def astream(self, input: Any, config: Any = None, **kwargs: Any) -> AsyncIterator[Any]:
+        """Stream the response; a cached response arrives as a single chunk.
+
+        The response is cached only once the stream has completed.
+        """
+        with span("llm", "llm", model=self._model_name(), stream=True) as attrs:
+            key = self.cache_key(input, **kwargs)
+            cached = self._lookup(key)
+            attrs["cache_hit"] = cached is not None
+            if cached is not None:
+                from langchain_core.messages import AIMessageChunk
+                
+                yield AIMessageChunk(content=cached.content, response_metadata={"cache_hit": True})
+                return
+            start = time.perf_counter()
+            parts = []
+            async for chunk in self.model.astream(input, config, **kwargs):
+                if "first_token_seconds" not in attrs:
+                    attrs["first_token_seconds"] = time.perf_counter() - start
+                record_usage(attrs, chunk)
+                parts.append(chunk.content if isinstance(chunk.content, str) else "")
+                yield chunk
+            self.cache.put(key, json.dumps({"content": "".join(parts)}))
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "model":
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+# Seconds a cached Tavily or browser search result stays fresh
+SEARCH_CACHE_MAX_AGE = float(os.getenv("SEARCH_CACHE_MAX_AGE", str(3 * 24 * 3600)))
+# Minimum keyword overlap (Jaccard) for a cached query to answer a near-identical one
+SEARCH_CACHE_SIMILARITY = float(os.getenv("SEARCH_CACHE_SIMILARITY", "0.8"))
+# Set to 1 to always run fresh searches (results are still written to the cache)
+SEARCH_CACHE_BYPASS = os.getenv("SEARCH_CACHE_BYPASS", "").lower() in ("1", "true", "yes")
+
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from how in into is it of on or the this to what with".split()
+)
+
+def normalize_query(query: str) -> str:
+    """Reduce a query to its sorted, lower-cased keywords so reworded duplicates share a key"""
+    words = re.findall(r"\w+", query.lower())
+    return " ".join(sorted({word for word in words if word not in _STOPWORDS}))
+
+class SearchCache:
+    """SQLite-backed store of search results keyed by normalized query"""
+
+    def __init__(self, path: str, max_age: float = SEARCH_CACHE_MAX_AGE, similarity: float = SEARCH_CACHE_SIMILARITY):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_age = max_age
+        self.similarity = similarity
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS search_cache ("
+            "kind TEXT NOT NULL, key TEXT NOT NULL, results TEXT NOT NULL, created REAL NOT NULL, "
+            "PRIMARY KEY (kind, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS search_cache_created ON search_cache (kind, created)")
+        self._conn.commit()
+
+    def get(self, kind: str, query: str) -> Optional[List[Dict[str, Any]]]:
+        """Return fresh results for query (or a near-identical one) from the given search kind"""
+        key = normalize_query(query)
+        oldest = time.time() - self.max_age
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT results FROM search_cache WHERE kind = ? AND key = ? AND created >= ?",
+                (kind, key, oldest)
+            ).fetchone()
+            if row is None and key:
+                # Fall back to the most similar fresh query with enough keyword overlap
+                words = set(key.split())
+                best_score = 0.0
+                for cached_key, results in self._conn.execute(
+                    "SELECT key, results FROM search_cache WHERE kind = ? AND created >= ?", (kind, oldest)
+                ):
+                    cached_words = set(cached_key.split())
+                    score = len(words & cached_words) / len(words | cached_words)
+                    if score >= self.similarity and score > best_score:
+                        best_score, row = score, (results,)
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, kind: str, query: str, results: List[Dict[str, Any]]) -> None:
+        """Store results for query, replacing any older entry with the same normalized key"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_cache (kind, key, results, created) VALUES (?, ?, ?, ?)",
+                (kind, normalize_query(query), json.dumps(results, default=str), time.time())
+            )
+            self._conn.execute("DELETE FROM search_cache WHERE created < ?", (time.time() - self.max_age,))
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the current number of entries"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+_search_cache = None
+
+def get_search_cache() -> SearchCache:
+    """Return the process-wide search cache, creating it on first use"""
+    global _search_cache
+    if _search_cache is None:
+        _search_cache = SearchCache(os.path.join(CACHE_DIR, "search_cache.sqlite3"))
+    return _search_cache
+
+def _normalize_url(url: str) -> str:
+    """Canonicalize a URL so trivially different links to the same page compare equal"""
+    parts = urlsplit(url.strip())
+    query = "&".join(sorted(p for p in parts.query.split("&") if p and not p.startswith("utm_")))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/"), query, ""))
+
+def dedupe_results(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Drop results whose URL or content was already seen, keeping the first occurrence"""
+    seen_urls = set()
+    seen_content = set()
+    unique_results = []
+    for result in results:
+        url = result.get("url", "")
+        # Placeholder ids such as browser_search_result_1 are not real links
+        url_key = _normalize_url(url) if "://" in url else None
+        content_key = hashlib.sha256(" ".join(str(result.get("content", "")).lower().split()).encode("utf-8")).hexdigest()
+        if (url_key and url_key in seen_urls) or content_key in seen_content:
+            continue
+        if url_key:
+            seen_urls.add(url_key)
+        seen_content.add(content_key)
+        unique_results.append(result)
+    return unique_results
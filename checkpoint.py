@@ -0,0 +1,119 @@
+import os
+import pickle
+import threading
+import uuid
+from datetime import datetime
+from typing import List, Optional
+
+from langgraph.checkpoint.memory import InMemorySaver
+
+from cache import CACHE_DIR
+
+# Directory holding one checkpoint file per workflow run
+RUNS_DIR = os.getenv("OPENPAPER_RUNS_DIR", os.path.join(CACHE_DIR, "runs"))
+
+class FileCheckpointSaver(InMemorySaver):
+    """LangGraph checkpointer that keeps every run (thread) in its own pickle file.
+
+    Checkpoints are held in memory like InMemorySaver and the run's file is
+    rewritten atomically after every write, so a crashed process can resume the
+    run from its last completed node. Runs are loaded from disk on first access.
+    """
+
+    def __init__(self, directory: str = RUNS_DIR):
+        super().__init__()
+        self.directory = directory
+        self._loaded = set()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def run_path(self, thread_id: str) -> str:
+        return os.path.join(self.directory, f"{thread_id}.pkl")
+
+    def _load(self, thread_id: str) -> None:
+        if thread_id in self._loaded:
+            return
+        self._loaded.add(thread_id)
+        path = self.run_path(thread_id)
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as f:
+            saved = pickle.load(f)
+        self.storage[thread_id].update(saved["storage"])
+        self.writes.update(saved["writes"])
+
+    def _save(self, thread_id: str) -> None:
+        saved = {
+            "storage": dict(self.storage[thread_id]),
+            "writes": {key: value for key, value in self.writes.items() if key[0] == thread_id},
+        }
+        path = self.run_path(thread_id)
+        with self._lock:
+            with open(path + ".tmp", "wb") as f:
+                pickle.dump(saved, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(path + ".tmp", path)
+
+    def get_tuple(self, config):
+        self._load(config["configurable"]["thread_id"])
+        return super().get_tuple(config)
+
+    def list(self, config, **kwargs):
+        if config:
+            self._load(config["configurable"]["thread_id"])
+        return super().list(config, **kwargs)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        self._load(thread_id)
+        result = super().put(config, checkpoint, metadata, new_versions)
+        self._save(thread_id)
+        return result
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        thread_id = config["configurable"]["thread_id"]
+        self._load(thread_id)
+        super().put_writes(config, writes, task_id, task_path)
+        self._save(thread_id)
+
+    def delete_run(self, thread_id: str) -> bool:
+        """Forget a run's checkpoints in memory and on disk; returns False if there was none"""
+        self._load(thread_id)
+        with self._lock:
+            self.storage.pop(thread_id, None)
+            for key in [key for key in self.writes if key[0] == thread_id]:
+                del self.writes[key]
+            path = self.run_path(thread_id)
+            if not os.path.exists(path):
+                return False
+            os.remove(path)
+            return True
+
+    def list_runs(self) -> List[str]:
+        """Return the ids of all runs stored on disk, newest first"""
+        files = [f for f in os.listdir(self.directory) if f.endswith(".pkl")]
+        files.sort(key=lambda f: os.path.getmtime(os.path.join(self.directory, f)), reverse=True)
+        return [f[:-len(".pkl")] for f in files]
+
+_checkpointer = None
+
+def get_checkpointer() -> FileCheckpointSaver:
+    """Return the process-wide checkpointer, creating it on first use"""
+    global _checkpointer
+    if _checkpointer is None:
+        _checkpointer = FileCheckpointSaver()
+    return _checkpointer
+
+def new_run_id() -> str:
+    """Create a unique, time-ordered id for a workflow run"""
+    return f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+def run_config(run_id: str) -> dict:
+    """LangGraph config selecting the checkpoints of a run"""
+    return {"configurable": {"thread_id": run_id}}
+
+def load_run_state(run_id: str) -> Optional[dict]:
+    """Latest stored state of a run, read without building the workflow graph"""
+    saved = get_checkpointer().get_tuple(run_config(run_id))
+    if saved is None:
+        return None
+    return {key: value for key, value in saved.checkpoint["channel_values"].items() if not key.startswith("__")}
@@ -0,0 +1,384 @@
+import os
+import time
+import json
+import random
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional
+
+import httpx
+import requests
+
+from instrumentation import add_to_span
+
+# Groq model used for every LLM call
+GROQ_MODEL = os.getenv("GROQ_MODEL", "deepseek-r1-distill-llama-70b")
+# Groq limits shared by every model client in the process (0 disables a limit)
+GROQ_REQUESTS_PER_MINUTE = float(os.getenv("GROQ_REQUESTS_PER_MINUTE", "30"))
+GROQ_TOKENS_PER_MINUTE = float(os.getenv("GROQ_TOKENS_PER_MINUTE", "0"))
+# Tavily requests allowed per minute (0 disables the limit)
+TAVILY_REQUESTS_PER_MINUTE = float(os.getenv("TAVILY_REQUESTS_PER_MINUTE", "60"))
+# Attempts per call, and the bounds of the jittered exponential backoff between them
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "5"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "1"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "60"))
+# Consecutive calls failing every attempt that open a provider's circuit, and seconds before it is tried again
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "60"))
+# Override the Tavily endpoint, e.g. to point at a local stub server (Groq reads GROQ_API_BASE)
+TAVILY_BASE_URL = os.getenv("TAVILY_BASE_URL", "")
+
+# Responses worth retrying: rate limited or a transient server error
+RETRY_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a provider whose recent calls kept failing"""
+
+class RetryableError(Exception):
+    """A failed attempt that may succeed if repeated"""
+
+    def __init__(self, message: str, status: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at `per_minute` tokens per minute.
+
+    Callers reserve tokens up front and sleep for the returned delay, so the
+    bucket works from both threads and coroutines and serves callers in order.
+    After a rate-limit response the rate is halved and then recovers gradually.
+    """
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.per_minute = per_minute
+        self.capacity = capacity if capacity is not None else max(1.0, per_minute / 6)
+        self._tokens = self.capacity
+        self._factor = 1.0
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        rate = self.per_minute * self._factor / 60.0
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * rate)
+        self._updated = now
+
+    def reserve(self, amount: float = 1) -> float:
+        """Take `amount` tokens and return the seconds to wait before using them"""
+        if self.per_minute <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # The bucket goes negative by what queued callers have reserved, so each one waits
+            # until the tokens of everyone ahead of it have been refilled
+            self._tokens -= amount
+            deficit = -self._tokens if self._tokens < 0 else 0.0
+            delay = deficit / (self.per_minute * self._factor / 60.0)
+            return max(delay, self._paused_until - now)
+
+    def charge(self, amount: float) -> None:
+        """Adjust the bucket by tokens actually used beyond (or below) what was reserved"""
+        if self.per_minute <= 0:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens - amount)
+
+    def throttle(self, seconds: float) -> None:
+        """Pause every caller for `seconds` and halve the rate after the provider pushed back"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._factor = max(0.125, self._factor / 2)
+
+    def recover(self) -> None:
+        """Move the rate back towards the configured limit after a successful call"""
+        if self._factor < 1.0:
+            with self._lock:
+                self._refill(time.monotonic())
+                self._factor = min(1.0, self._factor * 1.25)
+
+class CircuitBreaker:
+    """Fail fast after `threshold` consecutive failures, then let one trial call through after `reset_seconds`"""
+
+    def __init__(self, name: str, threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_seconds: float = CIRCUIT_RESET_SECONDS):
+        self.name = name
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset_seconds else "open"
+
+    def check(self) -> None:
+        """Raise CircuitOpenError while the circuit is open"""
+        with self._lock:
+            if self.state == "open":
+                remaining = self.reset_seconds - (time.monotonic() - self.opened_at)
+                raise CircuitOpenError(f"{self.name} circuit open after {self.failures} consecutive failures, "
+                                       f"retrying in {remaining:.1f}s")
+            if self.state == "half-open":
+                # Only the first caller gets the trial; the rest wait for its outcome
+                self.opened_at = time.monotonic()
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds requested by a Retry-After header (delta seconds or an HTTP date)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def as_retryable(error: Exception) -> Optional[RetryableError]:
+    """Describe a provider exception as a RetryableError, or None if retrying cannot help"""
+    if isinstance(error, RetryableError):
+        return error
+    response = getattr(error, "response", None)
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    # Tavily turns a 429 into this exception without keeping the response
+    if status is None and type(error).__name__ == "UsageLimitExceededError":
+        status = 429
+    if status in RETRY_STATUSES:
+        headers = getattr(response, "headers", None) or {}
+        return RetryableError(str(error), status, parse_retry_after(headers.get("retry-after")))
+    if status is None and isinstance(error, (httpx.TransportError, requests.ConnectionError,
+                                             requests.Timeout, ConnectionError, TimeoutError)):
+        return RetryableError(f"{type(error).__name__}: {error}")
+    return None
+
+class ProviderGate:
+    """Rate limits, retries and circuit breaker shared by every call to one provider"""
+
+    def __init__(self, name: str, requests_per_minute: float, tokens_per_minute: float = 0):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute, capacity=tokens_per_minute)
+        self.breaker = CircuitBreaker(name)
+
+    def _admit(self, tokens: float) -> float:
+        """Reserve quota for one attempt, returning the seconds to wait first"""
+        return max(self.requests.reserve(1), self.tokens.reserve(tokens) if tokens else 0.0)
+
+    def _failed(self, error: RetryableError, attempt: int) -> float:
+        """Return the backoff before retrying a failed attempt"""
+        delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt) * random.uniform(0.5, 1.0)
+        if error.retry_after is not None:
+            delay = min(RETRY_MAX_DELAY, max(delay, error.retry_after))
+        if error.status == 429:
+            # Slow down every caller, not just this one
+            self.requests.throttle(delay)
+        add_to_span("retries")
+        print(f"{self.name} call failed ({error}), retry {attempt + 1} in {delay:.1f}s")
+        return delay
+
+    def _succeeded(self) -> None:
+        self.breaker.record_success()
+        self.requests.recover()
+
+    async def acall(self, send: Callable[[], Any], tokens: float = 0) -> Any:
+        """Await send() within the provider's limits, retrying transient failures"""
+        # The circuit is checked once per call, so a half-open trial keeps its retries
+        self.breaker.check()
+        for attempt in range(RETRY_MAX_ATTEMPTS):
+            await asyncio.sleep(self._admit(tokens))
+            try:
+                result = await send()
+            except Exception as e:
+                error = as_retryable(e)
+                if error is None:
+                    raise
+                if attempt == RETRY_MAX_ATTEMPTS - 1:
+                    self.breaker.record_failure()
+                    raise
+                await asyncio.sleep(self._failed(error, attempt))
+            else:
+                self._succeeded()
+                return result
+
+    def call(self, send: Callable[[], Any], tokens: float = 0) -> Any:
+        """Blocking version of acall for code running in a worker thread"""
+        # The circuit is checked once per call, so a half-open trial keeps its retries
+        self.breaker.check()
+        for attempt in range(RETRY_MAX_ATTEMPTS):
+            time.sleep(self._admit(tokens))
+            try:
+                result = send()
+            except Exception as e:
+                error = as_retryable(e)
+                if error is None:
+                    raise
+                if attempt == RETRY_MAX_ATTEMPTS - 1:
+                    self.breaker.record_failure()
+                    raise
+                time.sleep(self._failed(error, attempt))
+            else:
+                self._succeeded()
+                return result
+
+groq_gate = ProviderGate("Groq", GROQ_REQUESTS_PER_MINUTE, GROQ_TOKENS_PER_MINUTE)
+tavily_gate = ProviderGate("Tavily", TAVILY_REQUESTS_PER_MINUTE)
+
+def _estimate_request_tokens(request: httpx.Request) -> float:
+    """Rough prompt size of a chat completion request, about four bytes per token"""
+    return len(request.content) / 4 if request.content else 0
+
+def _raise_for_retry(response: httpx.Response) -> None:
+    if response.status_code in RETRY_STATUSES:
+        raise RetryableError(f"HTTP {response.status_code}", response.status_code,
+                             parse_retry_after(response.headers.get("retry-after")))
+
+def _used_tokens(response: httpx.Response) -> Optional[float]:
+    """Total tokens reported in a non-streaming chat completion response"""
+    if "json" not in response.headers.get("content-type", ""):
+        return None
+    try:
+        return float(json.loads(response.content)["usage"]["total_tokens"])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+class GatedAsyncTransport(httpx.AsyncBaseTransport):
+    """httpx transport sending every request through a ProviderGate.
+
+    Retryable responses are retried here; the last one is returned unchanged
+    so the SDK raises its usual error. Token usage reported by the provider
+    corrects the estimate reserved before the request.
+    """
+
+    def __init__(self, gate: ProviderGate, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.gate = gate
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        estimate = _estimate_request_tokens(request)
+        last_response = None
+
+        async def send() -> httpx.Response:
+            nonlocal last_response
+            response = await self.transport.handle_async_request(request)
+            if response.status_code in RETRY_STATUSES:
+                await response.aread()
+                last_response = response
+            _raise_for_retry(response)
+            return response
+
+        try:
+            response = await self.gate.acall(send, tokens=estimate)
+        except RetryableError:
+            if last_response is None:
+                raise
+            return last_response
+        if self.gate.tokens.per_minute > 0 and "text/event-stream" not in response.headers.get("content-type", ""):
+            await response.aread()
+            used = _used_tokens(response)
+            if used is not None:
+                self.gate.tokens.charge(used - estimate)
+        return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+class GatedTransport(httpx.BaseTransport):
+    """Blocking counterpart of GatedAsyncTransport for synchronous model calls"""
+
+    def __init__(self, gate: ProviderGate, transport: Optional[httpx.BaseTransport] = None):
+        self.gate = gate
+        self.transport = transport or httpx.HTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        estimate = _estimate_request_tokens(request)
+        last_response = None
+
+        def send() -> httpx.Response:
+            nonlocal last_response
+            response = self.transport.handle_request(request)
+            if response.status_code in RETRY_STATUSES:
+                response.read()
+                last_response = response
+            _raise_for_retry(response)
+            return response
+
+        try:
+            response = self.gate.call(send, tokens=estimate)
+        except RetryableError:
+            if last_response is None:
+                raise
+            return last_response
+        if self.gate.tokens.per_minute > 0 and "text/event-stream" not in response.headers.get("content-type", ""):
+            response.read()
+            used = _used_tokens(response)
+            if used is not None:
+                self.gate.tokens.charge(used - estimate)
+        return response
+
+    def close(self) -> None:
+        self.transport.close()
+
+def groq_chat_model(**kwargs: Any):
+    """ChatGroq whose requests all share the process-wide Groq limits, retries and circuit breaker"""
+    from langchain_groq import ChatGroq
+
+    # Retrying is left to the gate so attempts are not multiplied by the SDK's own retries
+    return ChatGroq(
+        max_retries=0,
+        http_client=httpx.Client(transport=GatedTransport(groq_gate)),
+        http_async_client=httpx.AsyncClient(transport=GatedAsyncTransport(groq_gate)),
+        **kwargs,
+    )
+
+_chat_models: Dict[bool, Any] = {}
+
+def get_chat_model(cached: bool = True):
+    """Return the process-wide GROQ_MODEL client, creating it on first use.
+
+    The cached model answers repeated prompts from the LLM cache; the uncached one
+    drives the browser agents, which need the full chat model interface.
+    """
+    if cached not in _chat_models:
+        model = groq_chat_model(model=GROQ_MODEL, reasoning_format="hidden")
+        if cached:
+            from cache import CachedChatModel
+            model = CachedChatModel(model)
+        _chat_models[cached] = model
+    return _chat_models[cached]
+
+class GatedTavilyClient:
+    """TavilyClient wrapper calling search through the shared Tavily gate"""
+
+    def __init__(self, client, gate: ProviderGate = tavily_gate):
+        self.client = client
+        self.gate = gate
+        if TAVILY_BASE_URL:
+            client.base_url = TAVILY_BASE_URL.rstrip("/")
+
+    def search(self, *args: Any, **kwargs: Any) -> Dict[str, Any]:
+        return self.gate.call(lambda: self.client.search(*args, **kwargs))
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "client":
+            raise AttributeError(name)
+        return getattr(self.client, name)
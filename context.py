@@ -0,0 +1,220 @@
+import os
+import re
+import math
+import functools
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+from cache import CACHE_DIR
+
+# Target size of a research chunk in characters
+CHUNK_CHARS = int(os.getenv("CONTEXT_CHUNK_CHARS", "600"))
+# Rough characters per token, used when no tokenizer is available
+CHARS_PER_TOKEN = 4
+# tiktoken encoding used to count prompt tokens; set to "" to always use the estimate.
+# The Groq models use their own tokenizers, so counts are close rather than exact
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
+# Seconds the tokenizer may take to load (and on first use download) before the estimate is used instead
+TOKENIZER_LOAD_TIMEOUT = float(os.getenv("TOKENIZER_LOAD_TIMEOUT", "10"))
+# Context windows in tokens, extended or overridden by MODEL_CONTEXT_WINDOWS="model=tokens,..."
+MODEL_CONTEXT_WINDOWS = {
+    "deepseek-r1-distill-llama-70b": 131072,
+    "llama-3.3-70b-versatile": 131072,
+    "llama-3.1-8b-instant": 131072,
+    "qwen-qwq-32b": 131072,
+    "mixtral-8x7b-32768": 32768,
+    "llama3-70b-8192": 8192,
+    "llama3-8b-8192": 8192,
+    "gemma2-9b-it": 8192,
+}
+MODEL_CONTEXT_WINDOWS.update(
+    (name.strip(), int(tokens)) for name, tokens in
+    (entry.split("=", 1) for entry in os.getenv("MODEL_CONTEXT_WINDOWS", "").split(",") if "=" in entry)
+)
+# Window assumed for models missing from the table
+DEFAULT_CONTEXT_WINDOW = int(os.getenv("DEFAULT_CONTEXT_WINDOW", "8192"))
+# Share of the window left unused to absorb the difference between our counts and the model's tokenizer
+TOKEN_COUNT_MARGIN = 0.1
+
+_WORD_RE = re.compile(r"\w+")
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how in into is it its of on or that the their this "
+    "to was were what which with".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case word tokens without stopwords"""
+    return [word for word in _WORD_RE.findall(text.lower()) if word not in _STOPWORDS]
+
+def estimate_tokens(text: str) -> int:
+    """Approximate the number of model tokens in text"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+def load_encoding(timeout: float = TOKENIZER_LOAD_TIMEOUT):
+    """Load the tiktoken encoding once for the process and return it, or None for the estimate.
+
+    tiktoken downloads the encoding on first use without a timeout, so the load
+    runs in a separate thread and is given up after timeout seconds. The file is
+    kept under the cache directory, so later runs load it without the network.
+    Whatever this returns is used for every count in the process, so prompts and
+    section fingerprints never switch counters halfway through a run. Entry points
+    call it at start-up, off the event loop.
+    """
+    global _encoding, _encoding_loaded
+    with _encoding_lock:
+        if _encoding_loaded or not TOKENIZER_ENCODING:
+            _encoding_loaded = True
+            return _encoding
+        # Keep the downloaded file with the other caches rather than in the temporary directory
+        os.environ.setdefault("TIKTOKEN_CACHE_DIR", os.path.join(CACHE_DIR, "tiktoken"))
+        loaded: Dict[str, Any] = {}
+        
+        def load() -> None:
+            try:
+                import tiktoken
+                loaded["encoding"] = tiktoken.get_encoding(TOKENIZER_ENCODING)
+            except Exception as e:
+                loaded["error"] = e
+        
+        thread = threading.Thread(target=load, name="tokenizer-load", daemon=True)
+        thread.start()
+        thread.join(timeout)
+        # Read once: a load finishing after the timeout is only used by later processes
+        _encoding = loaded.get("encoding")
+        _encoding_loaded = True
+        if _encoding is None:
+            error = loaded.get("error") or TimeoutError(f"not loaded within {timeout:g}s")
+            print(f"Tokenizer {TOKENIZER_ENCODING!r} unavailable, estimating tokens from length: "
+                  f"{type(error).__name__}: {str(error)[:200]}")
+        return _encoding
+
+def get_encoding():
+    """Return the tiktoken encoding, or None when it is disabled or could not be loaded"""
+    return _encoding if _encoding_loaded else load_encoding()
+
+# Research chunks recur across the outline, draft and section prompts, so their counts are cached
+@functools.lru_cache(maxsize=65536)
+def count_tokens(text: str) -> int:
+    """Number of tokens in text, counted with the tokenizer when available"""
+    encoding = get_encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+def context_window(model: str) -> int:
+    """Context window of a model in tokens"""
+    return MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+
+def research_budget(prompt: str, model: str, output_tokens: int, cap: int = 0) -> int:
+    """Tokens of research that fit into a prompt for model.
+
+    prompt is the full prompt without its research (instructions, outline,
+    sources); output_tokens are kept free for the reply. The result is at most
+    cap, unless cap is 0.
+    """
+    usable = int(context_window(model) * (1 - TOKEN_COUNT_MARGIN))
+    available = max(0, usable - output_tokens - count_tokens(prompt))
+    return min(available, cap) if cap > 0 else available
+
+def split_chunks(text: str, chunk_chars: int = CHUNK_CHARS) -> List[str]:
+    """Split text into chunks of about chunk_chars, breaking on paragraphs, then sentences, then words"""
+    chunks = []
+    current = ""
+    for paragraph in _PARAGRAPH_RE.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        pieces = [paragraph] if len(paragraph) <= chunk_chars else _SENTENCE_RE.split(paragraph)
+        for piece in pieces:
+            # Pieces with no sentence breaks (e.g. stringified agent histories) are cut on whitespace
+            while len(piece) > chunk_chars:
+                cut = piece.rfind(" ", 0, chunk_chars)
+                cut = cut if cut > 0 else chunk_chars
+                if current:
+                    chunks.append(current)
+                    current = ""
+                chunks.append(piece[:cut])
+                piece = piece[cut:].lstrip()
+            if current and len(current) + len(piece) + 1 > chunk_chars:
+                chunks.append(current)
+                current = ""
+            current = f"{current} {piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+class BM25:
+    """Okapi BM25 ranking over a fixed list of tokenized documents"""
+
+    def __init__(self, documents: List[List[str]], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_counts = [Counter(document) for document in documents]
+        self.lengths = [len(document) for document in documents]
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        document_frequency = Counter()
+        for counts in self.term_counts:
+            document_frequency.update(counts.keys())
+        total = len(documents)
+        self.idf = {
+            term: math.log(1 + (total - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in document_frequency.items()
+        }
+
+    def scores(self, query: List[str]) -> List[float]:
+        """Score every document against the query terms"""
+        query_terms = [term for term in set(query) if term in self.idf]
+        average_length = self.average_length or 1.0
+        results = []
+        for counts, length in zip(self.term_counts, self.lengths):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * length / average_length)
+            for term in query_terms:
+                frequency = counts.get(term)
+                if frequency:
+                    score += self.idf[term] * frequency * (self.k1 + 1) / (frequency + norm)
+            results.append(score)
+        return results
+
+def build_context(research_results: List[Dict[str, Any]], query: str, token_budget: int) -> str:
+    """Pack the research chunks most relevant to query into at most token_budget tokens.
+
+    Results are split into chunks and ranked with BM25 against the query. The
+    best chunks that fit the budget are kept and emitted in their original order,
+    so chunks from the same source stay together.
+    """
+    chunks: List[Tuple[int, int, str]] = []
+    seen = set()
+    for result_index, result in enumerate(research_results):
+        if 'content' not in result:
+            continue
+        for chunk_index, chunk in enumerate(split_chunks(str(result['content']))):
+            if chunk not in seen:
+                seen.add(chunk)
+                chunks.append((result_index, chunk_index, chunk))
+    if not chunks:
+        return ""
+
+    scores = BM25([tokenize(chunk) for _, _, chunk in chunks]).scores(tokenize(query))
+    # Highest score first; ties keep the original order
+    ranked = sorted(range(len(chunks)), key=lambda i: -scores[i])
+
+    selected = []
+    used_tokens = 0
+    for i in ranked:
+        # One more token for the paragraph break that joins the chunks
+        tokens = count_tokens(chunks[i][2]) + 1
+        if used_tokens + tokens <= token_budget:
+            selected.append(i)
+            used_tokens += tokens
+
+    selected.sort()
+    return "\n\n".join(chunks[i][2] for i in selected)
@@ -0,0 +1,173 @@
+import os
+import re
+import json
+import html
+import asyncio
+import tempfile
+from datetime import datetime
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from pdf_generator import build_report_pdf, parse_markdown
+
+# Formats written by default, any of: pdf, md, html, json
+EXPORT_FORMATS = [f.strip() for f in os.getenv("EXPORT_FORMATS", "pdf,md,html,json").split(",") if f.strip()]
+# Directory receiving the exported files
+REPORTS_DIR = os.getenv("REPORTS_DIR", os.path.join(os.path.expanduser("~"), "research_papers"))
+# "thread" or "process": where the writers run
+EXPORT_EXECUTOR = os.getenv("EXPORT_EXECUTOR", "thread")
+# Number of writers running at once across all exports
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "4"))
+
+def report_basename(result, current_date: str, run_id: Optional[str] = None) -> str:
+    """File name, without extension, shared by every export of a report.
+
+    The run id keeps papers from different runs of the same topic apart; without
+    one the date is used, and a later report on the topic that day replaces it.
+    """
+    safe_topic = re.sub(r'[^\w\s-]', '', result["topic"]).strip().replace(' ', '_')
+    if run_id:
+        safe_run_id = re.sub(r'[^\w-]', '', run_id)
+        return f"research_paper_{safe_topic}_{safe_run_id}"
+    return f"research_paper_{safe_topic}_{current_date}"
+
+@contextmanager
+def atomic_output(path: str, mode: str = "w") -> Iterator[Any]:
+    """Open a temporary file next to path and move it into place only if writing succeeds"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, mode, **({} if "b" in mode else {"encoding": "utf-8"})) as f:
+            yield f
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+def write_pdf(result, path: str, current_date: str) -> None:
+    pdf = build_report_pdf(result, current_date)
+    with atomic_output(path, "wb") as f:
+        f.write(pdf.output(dest="S").encode("latin-1"))
+
+def write_markdown(result, path: str, current_date: str) -> None:
+    with atomic_output(path) as f:
+        f.write(f"# {result['topic']}\n\n_Generated on: {current_date}_\n\n")
+        f.write(f"## Outline\n\n{result['outline']}\n\n")
+        f.write(f"## Research Paper\n\n{result['draft']}\n\n")
+        f.write("## Sources\n\n")
+        for i, source in enumerate(result["sources"]):
+            f.write(f"{i+1}. {source}\n")
+
+def _markdown_to_html(text: str) -> Iterator[str]:
+    """Yield HTML for markdown text, one block at a time"""
+    paragraph: List[str] = []
+    in_list = False
+    for block in parse_markdown(text) + [None]:
+        if paragraph and (block is None or block.kind != "line"):
+            yield f"<p>{' '.join(paragraph)}</p>\n"
+            paragraph = []
+        if in_list and (block is None or block.kind != "bullet"):
+            yield "</ul>\n"
+            in_list = False
+        if block is None:
+            break
+        text = html.escape(block.text)
+        if block.kind == "heading":
+            level = min(block.level + 1, 6)
+            yield f"<h{level}>{text}</h{level}>\n"
+        elif block.kind == "numbered":
+            yield f"<p><strong>{text}</strong></p>\n"
+        elif block.kind == "bullet":
+            if not in_list:
+                yield "<ul>\n"
+                in_list = True
+            yield f'<li style="margin-left: {block.level * 1.5}em">{text}</li>\n'
+        elif block.kind == "code":
+            yield f"<pre><code>{text}</code></pre>\n"
+        elif block.kind == "table":
+            rows = "".join(
+                "<tr>" + "".join(f"<td>{cell}</td>" for cell in row.split(" | ")) + "</tr>"
+                for row in text.split("\n")
+            )
+            yield f"<table>{rows}</table>\n"
+        elif block.kind == "line":
+            paragraph.append(text.strip())
+
+def write_html(result, path: str, current_date: str) -> None:
+    topic = html.escape(result["topic"])
+    with atomic_output(path) as f:
+        f.write(f'<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n<title>{topic}</title>\n'
+                '<style>body{max-width:50em;margin:auto;font-family:serif}'
+                'table{border-collapse:collapse}td{border:1px solid #999;padding:2px 6px}</style>\n'
+                f'</head>\n<body>\n<h1>{topic}</h1>\n<p><em>Generated on: {current_date}</em></p>\n')
+        f.write('<section id="outline">\n<h2>Outline</h2>\n')
+        f.writelines(_markdown_to_html(result["outline"]))
+        f.write('</section>\n<section id="paper">\n<h2>Research Paper</h2>\n')
+        f.writelines(_markdown_to_html(result["draft"]))
+        f.write('</section>\n<section id="sources">\n<h2>Sources</h2>\n<ol>\n')
+        for source in result["sources"]:
+            source = html.escape(source)
+            link = f'<a href="{source}">{source}</a>' if "://" in source else source
+            f.write(f"<li>{link}</li>\n")
+        f.write("</ol>\n</section>\n</body>\n</html>\n")
+
+def write_json(result, path: str, current_date: str) -> None:
+    with atomic_output(path) as f:
+        json.dump(dict(result), f, indent=2, default=str)
+
+WRITERS = {
+    "pdf": (".pdf", write_pdf),
+    "md": (".md", write_markdown),
+    "html": (".html", write_html),
+    "json": (".json", write_json),
+}
+
+def _run_writer(fmt: str, result, path: str, current_date: str) -> Dict[str, Any]:
+    """Run one writer and describe the outcome instead of raising"""
+    try:
+        WRITERS[fmt][1](result, path, current_date)
+        return {"status": "ok", "path": path}
+    except Exception as e:
+        return {"status": "error", "path": path, "error": f"{type(e).__name__}: {str(e)}"}
+
+_executor: Optional[Executor] = None
+
+def get_export_executor() -> Executor:
+    """Return the pool shared by all exports, creating it on first use"""
+    global _executor
+    if _executor is None:
+        if EXPORT_EXECUTOR == "process":
+            _executor = ProcessPoolExecutor(max_workers=EXPORT_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="export")
+    return _executor
+
+async def export_report(result, formats: Optional[List[str]] = None, directory: Optional[str] = None,
+                        run_id: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """Write the report in every requested format concurrently on the export pool.
+
+    Each file is written to a temporary file and renamed into place, so readers
+    never see a partial export. Files are named after the run when run_id is
+    given. Returns a status entry per format.
+    """
+    formats = formats or EXPORT_FORMATS
+    directory = directory or REPORTS_DIR
+    current_date = datetime.now().strftime("%Y-%m-%d")
+    basename = report_basename(result, current_date, run_id)
+    # Only plain data crosses into the pool (and possibly another process)
+    result = dict(result)
+
+    statuses = {}
+    pending = {}
+    loop = asyncio.get_running_loop()
+    for fmt in formats:
+        if fmt not in WRITERS:
+            statuses[fmt] = {"status": "error", "error": f"unknown export format {fmt!r}"}
+            continue
+        path = os.path.join(directory, basename + WRITERS[fmt][0])
+        pending[fmt] = loop.run_in_executor(get_export_executor(), _run_writer, fmt, result, path, current_date)
+    for fmt, status in zip(pending, await asyncio.gather(*pending.values())):
+        statuses[fmt] = status
+    return statuses
@@ -0,0 +1,195 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak memory is then left out of the run report
+    resource = None
+
+# Set to 1 to also write a Chrome trace (open in chrome://tracing or ui.perfetto.dev)
+TRACE_CHROME = os.getenv("TRACE_CHROME", "").lower() in ("1", "true", "yes")
+# Prices used for the cost estimate, in USD per million tokens
+LLM_INPUT_PRICE = float(os.getenv("LLM_INPUT_PRICE", "0.75"))
+LLM_OUTPUT_PRICE = float(os.getenv("LLM_OUTPUT_PRICE", "0.99"))
+
+# Attributes summed per span name in the run report
+_TOTALS = ("prompt_tokens", "completion_tokens", "retries", "bytes")
+
+def current_rss_mb() -> Optional[float]:
+    """Resident set size of this process in MB, where the platform exposes it"""
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6, 1)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def peak_rss_mb() -> Optional[float]:
+    """Highest resident set size this process has reached, in MB"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in kibibytes elsewhere
+    return round(peak / 1e6 if sys.platform == "darwin" else peak * 1024 / 1e6, 1)
+
+class RunTrace:
+    """Timed spans recorded during one workflow run"""
+
+    def __init__(self, run_id: str):
+        self.run_id = run_id
+        self.started_at = time.time()
+        self._origin = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self._lanes: Dict[Any, int] = {}
+        self._lock = threading.Lock()
+        self.rss_start_mb = current_rss_mb()
+
+    def _lane(self) -> int:
+        """Small integer for the current asyncio task (or thread) so overlapping spans get their own row"""
+        try:
+            owner = asyncio.current_task()
+        except RuntimeError:
+            owner = None
+        owner = owner if owner is not None else threading.get_ident()
+        with self._lock:
+            return self._lanes.setdefault(owner, len(self._lanes) + 1)
+
+    def add(self, name: str, category: str, start: float, end: float, attrs: Dict[str, Any]) -> None:
+        with self._lock:
+            self.spans.append({
+                "name": name,
+                "category": category,
+                "start": start - self._origin,
+                "duration": end - start,
+                "lane": attrs.pop("_lane", 0),
+                "attrs": attrs,
+            })
+
+    def report(self) -> Dict[str, Any]:
+        """Summarise the spans into per-name totals plus the raw span list"""
+        summary: Dict[str, Dict[str, Any]] = {}
+        for span in self.spans:
+            entry = summary.setdefault(span["name"], {"category": span["category"], "count": 0, "wall_seconds": 0.0,
+                                                      **{key: 0 for key in _TOTALS}})
+            entry["count"] += 1
+            entry["wall_seconds"] += span["duration"]
+            for key in _TOTALS:
+                entry[key] += span["attrs"].get(key) or 0
+        prompt_tokens = sum(s["attrs"].get("prompt_tokens") or 0 for s in self.spans if s["category"] != "node")
+        completion_tokens = sum(s["attrs"].get("completion_tokens") or 0 for s in self.spans if s["category"] != "node")
+        return {
+            "run_id": self.run_id,
+            "started_at": self.started_at,
+            "wall_seconds": max((s["start"] + s["duration"] for s in self.spans), default=0.0),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "estimated_cost_usd": round((prompt_tokens * LLM_INPUT_PRICE + completion_tokens * LLM_OUTPUT_PRICE) / 1e6, 6),
+            # Memory is per process: with several papers in flight the peak covers all of them
+            "rss_start_mb": self.rss_start_mb,
+            "rss_end_mb": current_rss_mb(),
+            "peak_rss_mb": peak_rss_mb(),
+            "summary": summary,
+            "spans": self.spans,
+        }
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """Spans in the Chrome trace event format"""
+        events = [{
+            "name": span["name"],
+            "cat": span["category"],
+            "ph": "X",
+            "ts": span["start"] * 1e6,
+            "dur": span["duration"] * 1e6,
+            "pid": 1,
+            "tid": span["lane"],
+            "args": span["attrs"],
+        } for span in self.spans]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, directory: str, chrome: bool = TRACE_CHROME) -> str:
+        """Write run_report.json (and trace.json when chrome is set) and return the report path"""
+        os.makedirs(directory, exist_ok=True)
+        report_path = os.path.join(directory, "run_report.json")
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2, default=str)
+        if chrome:
+            with open(os.path.join(directory, "trace.json"), "w", encoding="utf-8") as f:
+                json.dump(self.chrome_trace(), f, default=str)
+        return report_path
+
+_current_trace: ContextVar[Optional[RunTrace]] = ContextVar("current_trace", default=None)
+_current_attrs: ContextVar[Optional[Dict[str, Any]]] = ContextVar("current_span_attrs", default=None)
+
+@contextmanager
+def trace_run(run_id: str) -> Iterator[RunTrace]:
+    """Record every span opened in this context (and tasks started from it) into a new RunTrace"""
+    trace = RunTrace(run_id)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+@contextmanager
+def span(name: str, category: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+    """Time the enclosed block as a span of the current run.
+
+    Yields the span's attribute dict so the block can add measurements such as
+    token counts. Outside trace_run nothing is recorded.
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        attrs["_lane"] = trace._lane()
+    token = _current_attrs.set(attrs)
+    start = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        try:
+            _current_attrs.reset(token)
+        except ValueError:
+            # A span inside an async generator may be closed from another context
+            pass
+        if trace is not None:
+            trace.add(name, category, start, time.perf_counter(), attrs)
+
+def add_to_span(key: str, amount: float = 1) -> None:
+    """Add to a counter of the innermost open span, e.g. retries made by a client below it"""
+    attrs = _current_attrs.get()
+    if attrs is not None:
+        attrs[key] = (attrs.get(key) or 0) + amount
+
+def record_usage(attrs: Dict[str, Any], message: Any) -> None:
+    """Copy token usage from a chat model response into span attributes"""
+    usage = getattr(message, "usage_metadata", None) or {}
+    attrs["prompt_tokens"] = (attrs.get("prompt_tokens") or 0) + usage.get("input_tokens", 0)
+    attrs["completion_tokens"] = (attrs.get("completion_tokens") or 0) + usage.get("output_tokens", 0)
+
+def research_bytes(results: Any) -> int:
+    """Total size in bytes of the content of a list of research results (stored or inline)"""
+    return sum(result["size"] if "size" in result else len(str(result.get("content", "")).encode("utf-8"))
+               for result in results or [] if isinstance(result, dict))
+
+def traced_node(name: str, node):
+    """Wrap an async graph node so each execution is recorded as a span"""
+    @functools.wraps(node)
+    async def wrapper(state, **kwargs):
+        with span(name, "node") as attrs:
+            update = await node(state, **kwargs)
+            # Count research content only when the node produced new results
+            if isinstance(update, dict) and "research_results" in update:
+                attrs["bytes"] = research_bytes(update["research_results"])
+            attrs["rss_mb"] = current_rss_mb()
+            return update
+    return wrapper
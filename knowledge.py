@@ -0,0 +1,202 @@
+import os
+import time
+import sqlite3
+import hashlib
+import itertools
+import threading
+from typing import Any, Dict, List, Optional
+
+from cache import CACHE_DIR
+from context import split_chunks, tokenize
+
+# Set to 0 to neither consult nor grow the knowledge base of past research
+KNOWLEDGE_BASE = os.getenv("KNOWLEDGE_BASE", "1").lower() in ("1", "true", "yes")
+# Chunks looked up per query, and how many of them must match for a query to count as covered
+KNOWLEDGE_RESULTS = int(os.getenv("KNOWLEDGE_RESULTS", "8"))
+KNOWLEDGE_MIN_CHUNKS = int(os.getenv("KNOWLEDGE_MIN_CHUNKS", "4"))
+# Share of a query's keywords (an aspect's own keywords when looking up an aspect) each matching chunk must contain
+KNOWLEDGE_COVERAGE = float(os.getenv("KNOWLEDGE_COVERAGE", "0.8"))
+# Optional sentence-transformers model (run on the CPU) used to rerank keyword matches by meaning
+KNOWLEDGE_EMBEDDING_MODEL = os.getenv("KNOWLEDGE_EMBEDDING_MODEL", "")
+# Minimum cosine similarity of the best chunk when embeddings are used
+KNOWLEDGE_SIMILARITY = float(os.getenv("KNOWLEDGE_SIMILARITY", "0.5"))
+# Keyword matches reranked by embedding per lookup
+_CANDIDATES = 100
+# Postings a ranked lookup may read at most
+_MAX_POSTINGS = 5000
+
+_embedder = None
+_embedder_loaded = False
+
+def get_embedder():
+    """Return the sentence-transformers model, or None when embeddings are off or unavailable"""
+    global _embedder, _embedder_loaded
+    if not _embedder_loaded:
+        _embedder_loaded = True
+        if KNOWLEDGE_EMBEDDING_MODEL:
+            try:
+                from sentence_transformers import SentenceTransformer
+                _embedder = SentenceTransformer(KNOWLEDGE_EMBEDDING_MODEL, device="cpu")
+            except Exception as e:
+                print(f"Embedding model {KNOWLEDGE_EMBEDDING_MODEL!r} unavailable, using keyword search only: "
+                      f"{type(e).__name__}: {str(e)[:200]}")
+    return _embedder
+
+def _fts_query(terms: List[str], operator: str) -> str:
+    # Quoting keeps words such as "and" or "near" from being read as query syntax
+    return f" {operator} ".join(f'"{term}"' for term in terms)
+
+class KnowledgeBase:
+    """On-disk index of research chunks from every past run, across topics.
+
+    Chunks are kept once each in SQLite with an FTS5 inverted index. Lookups
+    bound the postings they read, so they stay fast as the corpus grows to
+    millions of chunks. With an embedding model configured, each chunk also
+    stores a vector used to rerank the keyword matches.
+    """
+
+    def __init__(self, path: str, embedder: Any = None):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.embedder = embedder
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks (id INTEGER PRIMARY KEY, hash TEXT NOT NULL UNIQUE, url TEXT NOT NULL, "
+            "title TEXT NOT NULL, topic TEXT NOT NULL, text TEXT NOT NULL, embedding BLOB, added REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5("
+            "text, title, content='chunks', content_rowid='id', tokenize='unicode61')"
+        )
+        self._conn.commit()
+
+    def _embed(self, texts: List[str]):
+        import numpy as np
+        return np.asarray(self.embedder.encode(texts, normalize_embeddings=True), dtype=np.float16)
+
+    def add_results(self, results: List[Dict[str, Any]], topic: str) -> int:
+        """Index the chunks of research results; returns the number of chunks not already known"""
+        rows = []
+        for result in results:
+            if result.get("kind") == "knowledge":
+                continue
+            url = result.get("url") or ", ".join(result.get("urls", []))
+            for chunk in split_chunks(str(result.get("content", ""))):
+                rows.append((hashlib.sha256(chunk.encode("utf-8")).hexdigest(), url, result.get("title", ""), chunk))
+        if not rows:
+            return 0
+        embeddings = self._embed([row[3] for row in rows]) if self.embedder is not None else None
+        added = 0
+        now = time.time()
+        with self._lock:
+            for i, (chunk_hash, url, title, chunk) in enumerate(rows):
+                embedding = embeddings[i].tobytes() if embeddings is not None else None
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO chunks (hash, url, title, topic, text, embedding, added) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", (chunk_hash, url, title, topic, chunk, embedding, now)
+                )
+                if cursor.rowcount:
+                    self._conn.execute("INSERT INTO chunks_fts (rowid, text, title) VALUES (?, ?, ?)",
+                                       (cursor.lastrowid, chunk, title))
+                    added += 1
+            self._conn.commit()
+        return added
+
+    def search(self, query: str, limit: int = KNOWLEDGE_RESULTS) -> List[Dict[str, Any]]:
+        """Return the chunks best matching query, best first.
+
+        Chunks containing every distinctive keyword are preferred; only when there
+        are too few of those are chunks matching any keyword considered.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        fetch = _CANDIDATES if self.embedder is not None else limit
+        rows: List[tuple] = []
+        with self._lock:
+            # Chunks containing each keyword, counted only up to the postings limit so common keywords stay cheap
+            frequency = {}
+            for term in terms:
+                count = self._conn.execute(
+                    "SELECT COUNT(*) FROM (SELECT rowid FROM chunks_fts WHERE chunks_fts MATCH ? LIMIT ?)",
+                    (_fts_query([term], "AND"), _MAX_POSTINGS + 1)
+                ).fetchone()[0]
+                if count:
+                    frequency[term] = count
+            if not frequency:
+                return []
+            known = sorted(frequency, key=frequency.get)
+            # Chunks with every keyword first. Ranking reads the whole postings list of each keyword, so only
+            # keywords with short lists are used; if every keyword is common, the newest chunks with all of them
+            # are taken instead, which stops reading early
+            selective = [term for term in known if frequency[term] <= _MAX_POSTINGS]
+            queries = [(_fts_query(selective, "AND"), "rank") if selective else (_fts_query(known, "AND"), "rowid DESC")]
+            # Then chunks with any keyword, reading postings for as many of the rarest keywords as the limit allows
+            any_terms = [term for term, read in zip(known, itertools.accumulate(frequency[term] for term in known))
+                         if read <= _MAX_POSTINGS]
+            if len(known) > 1 and any_terms:
+                queries.append((_fts_query(any_terms, "OR"), "rank"))
+            for match, order in queries:
+                seen = {row[0] for row in rows}
+                rows += [row for row in self._conn.execute(
+                    "SELECT c.id, c.url, c.title, c.topic, c.text, c.embedding FROM chunks_fts "
+                    f"JOIN chunks c ON c.id = chunks_fts.rowid WHERE chunks_fts MATCH ? ORDER BY chunks_fts.{order} LIMIT ?",
+                    (match, fetch)
+                ) if row[0] not in seen]
+                if len(rows) >= fetch:
+                    break
+        hits = [{"url": url, "title": title, "topic": topic, "content": text, "embedding": embedding}
+                for _, url, title, topic, text, embedding in rows[:fetch]]
+        if self.embedder is not None and hits:
+            import numpy as np
+            vector = self._embed([query])[0].astype(np.float32)
+            for hit in hits:
+                stored = hit["embedding"]
+                hit["similarity"] = float(np.frombuffer(stored, dtype=np.float16).astype(np.float32) @ vector) if stored else 0.0
+            hits.sort(key=lambda hit: -hit["similarity"])
+        for hit in hits:
+            del hit["embedding"]
+        return hits[:limit]
+
+    def lookup(self, query: str, item: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Return research records for query if the knowledge base covers it, else an empty list.
+
+        A query is covered when enough chunks each contain most of its keywords.
+        For an aspect of a topic only the aspect's own keywords are checked, as any
+        chunk about the topic has the topic's. Matching chunks from the same page
+        are merged into one record.
+        """
+        terms = set(tokenize(item if item is not None else query))
+        if not terms:
+            return []
+        hits = [hit for hit in self.search(query)
+                if len(terms.intersection(tokenize(hit["content"]))) >= KNOWLEDGE_COVERAGE * len(terms)]
+        if len(hits) < KNOWLEDGE_MIN_CHUNKS:
+            return []
+        if self.embedder is not None and hits[0]["similarity"] < KNOWLEDGE_SIMILARITY:
+            return []
+        records: Dict[str, Dict[str, Any]] = {}
+        for hit in hits:
+            record = records.setdefault(hit["url"], {"url": hit["url"], "title": hit["title"], "content": "",
+                                                     "kind": "knowledge"})
+            record["content"] = f"{record['content']}\n\n{hit['content']}".strip()
+            if item is not None:
+                record["outline_item"] = item
+        return list(records.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the number of chunks and topics indexed"""
+        with self._lock:
+            chunks, topics = self._conn.execute("SELECT COUNT(*), COUNT(DISTINCT topic) FROM chunks").fetchone()
+        return {"chunks": chunks, "topics": topics}
+
+_knowledge_base = None
+
+def get_knowledge_base() -> KnowledgeBase:
+    """Return the process-wide knowledge base, creating it on first use"""
+    global _knowledge_base
+    if _knowledge_base is None:
+        _knowledge_base = KnowledgeBase(os.path.join(CACHE_DIR, "knowledge.sqlite3"), get_embedder())
+    return _knowledge_base
@@ -1,24 +1,19 @@
 from dotenv import load_dotenv
 import os
 import asyncio
+import argparse
 import traceback
 
-# Load environment variables
+# Load environment variables; the Groq and Tavily clients read their API keys when first created
 load_dotenv()
-os.environ["GROQ_API_KEY"] = os.getenv("GROQ_API_KEY")
 
-# Import from our modules
+# Import from our modules. Only light modules are imported here: the workflow, browser
+# and model libraries are slow to load, so each command imports what it needs itself
 from models import ReportState
-from workflow import create_research_paper_workflow
-from pdf_generator import save_report_as_pdf
 
-async def run_research_paper_workflow(topic):
-    """Run the research paper generation workflow"""
-    # Create the research paper workflow
-    research_workflow = create_research_paper_workflow()
-    
-    # Initialize the state
-    initial_state = {
+def create_initial_state(topic) -> ReportState:
+    """Build the starting state of the workflow for a topic"""
+    return {
         "system_prompt": f"Generate a research paper about {topic}",
         "topic": topic,
         "outline": "",
@@ -26,42 +21,255 @@ async def run_research_paper_workflow(topic):
         "sources": [],
         "intermediate_steps": ["Started workflow"],
         "research_results": [],
+        "sections": [],
         "score": []
     }
+
+async def run_research_paper_workflow(topic, research_workflow=None, run_id=None):
+    """Run the research paper generation workflow.
+
+    A compiled workflow can be passed in so several papers share one graph. When
+    run_id names an existing run, that run is resumed from its last completed node
+    and topic is ignored.
+    """
+    from workflow import create_research_paper_workflow
+    from export import export_report
+    from cache import get_llm_cache, get_search_cache
+    from checkpoint import RUNS_DIR, new_run_id, run_config
+    from instrumentation import trace_run, span
+    from context import load_encoding
     
-    # Run the workflow
-    print(f"Starting research paper generation on: {topic}")
-    try:
-        result = await research_workflow.ainvoke(initial_state)
-        
-        # Print the results
-        print("\n=== RESEARCH PAPER GENERATION COMPLETE ===")
-        print(f"\nTOPIC: {result['topic']}")
-        print("\nOUTLINE:")
-        print(result['outline'])
-        print("\nDRAFT:")
-        print(result['draft'])
-        print("\nSOURCES:")
-        for source in result['sources']:
-            print(f"- {source}")
-        
-        # Save the report as PDF
-        save_report_as_pdf(result)
-        
-        return result
-    except Exception as e:
-        print(f"An error occurred in the research workflow: {type(e).__name__}: {str(e)}")
-        traceback.print_exc()
+    # Load the tokenizer before any prompt is built, without blocking the event loop
+    await asyncio.to_thread(load_encoding)
+    
+    # Create the research paper workflow
+    if research_workflow is None:
+        research_workflow = create_research_paper_workflow()
+    
+    workflow_input = create_initial_state(topic)
+    if run_id is not None:
+        snapshot = await research_workflow.aget_state(run_config(run_id))
+        if not snapshot.values:
+            print(f"No stored run with id {run_id}")
+            return None
+        # Passing no input continues the run from its last checkpoint
+        workflow_input = None
+        topic = snapshot.values["topic"]
+        print(f"Resuming run {run_id} on: {topic}")
+    else:
+        run_id = new_run_id()
+        print(f"Starting research paper generation on: {topic} (run {run_id})")
+    
+    # Run the workflow, recording timings, tokens and sizes into the run report
+    with trace_run(run_id) as trace:
+        try:
+            result = await research_workflow.ainvoke(workflow_input, run_config(run_id))
+            
+            # Print the results
+            print("\n=== RESEARCH PAPER GENERATION COMPLETE ===")
+            print(f"\nTOPIC: {result['topic']}")
+            print("\nOUTLINE:")
+            print(result['outline'])
+            print("\nDRAFT:")
+            print(result['draft'])
+            print("\nSOURCES:")
+            for source in result['sources']:
+                print(f"- {source}")
+            
+            # Write every export format concurrently and report how each went
+            with span("export", "export") as attrs:
+                exports = await export_report(result, run_id=run_id)
+                attrs["failed"] = [fmt for fmt, status in exports.items() if status["status"] != "ok"]
+            print()
+            for fmt, status in exports.items():
+                if status["status"] == "ok":
+                    print(f"Saved {fmt.upper()}: {status['path']}")
+                else:
+                    print(f"Error saving {fmt.upper()}: {status['error']}")
+            
+            cache_stats = get_llm_cache().stats()
+            print(f"\nLLM cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, {cache_stats['entries']} entries")
+            search_stats = get_search_cache().stats()
+            print(f"Search cache: {search_stats['hits']} hits, {search_stats['misses']} misses, {search_stats['entries']} entries")
+            
+            return result
+        except Exception as e:
+            print(f"An error occurred in the research workflow: {type(e).__name__}: {str(e)}")
+            traceback.print_exc()
+            print(f"\nCompleted steps are saved. Resume with: python main.py run --resume {run_id}")
+            return None
+        finally:
+            print(f"Run report saved: {trace.write(os.path.join(RUNS_DIR, run_id))}")
+            report = trace.report()
+            if report["peak_rss_mb"] is not None:
+                print(f"Peak memory: {report['peak_rss_mb']:.0f} MB")
+
+def render_run(run_id, formats=("pdf",)):
+    """Re-export a stored run from its latest state without building the workflow"""
+    from export import export_report
+    from checkpoint import load_run_state
+    
+    state = load_run_state(run_id)
+    if not state:
+        print(f"No stored run with id {run_id}")
+        return None
+    if "Generated draft" not in state.get("intermediate_steps", []):
+        print(f"Run {run_id} has not finished; rendering its current state")
+    exports = asyncio.run(export_report(state, list(formats), run_id=run_id))
+    for fmt, status in exports.items():
+        if status["status"] == "ok":
+            print(f"Saved {fmt.upper()}: {status['path']}")
+        else:
+            print(f"Error saving {fmt.upper()}: {status['error']}")
+    return exports
+
+async def regenerate_run(run_id, sections=(), research_items=(), formats=("pdf",)):
+    """Redraft the sections of a stored run whose inputs changed, or that were asked for, and re-export it.
+
+    sections are 1-based section numbers or parts of section titles; each of
+    research_items is researched afresh first. Everything else, including the
+    research and the outline, is reused from the stored state.
+    """
+    from workflow import create_research_paper_workflow, parse_outline_sections, regenerate_draft
+    from export import export_report
+    from checkpoint import run_config
+    from scheduler import close_browser_pool
+    from context import load_encoding
+    
+    # Section fingerprints depend on token counts, so load the tokenizer before comparing them
+    await asyncio.to_thread(load_encoding)
+    research_workflow = create_research_paper_workflow()
+    config = run_config(run_id)
+    state = (await research_workflow.aget_state(config)).values
+    if not state or not state.get("outline"):
+        print(f"No stored run with an outline for id {run_id}")
         return None
+    
+    outline_sections = parse_outline_sections(state["outline"])
+    redo = set()
+    for wanted in sections:
+        matches = [i for i, section in enumerate(outline_sections)
+                   if (wanted.isdigit() and int(wanted) == i + 1) or (not wanted.isdigit() and wanted.lower() in section["title"].lower())]
+        if not matches:
+            print(f"No section matches {wanted!r}; sections are:")
+            for i, section in enumerate(outline_sections):
+                print(f"{i+1}. {section['title']}")
+            return None
+        redo.update(matches)
+    
+    try:
+        update, titles = await regenerate_draft(state, redo, research_items, config)
+    finally:
+        await close_browser_pool()
+    # Record the new draft as the draft node's output, so the run's latest state includes it
+    await research_workflow.aupdate_state(config, update, as_node="draft_node")
+    print(f"Redrafted {len(titles)} section(s)" + (": " + "; ".join(titles) if titles else ", nothing had changed"))
+    
+    exports = await export_report((await research_workflow.aget_state(config)).values, list(formats), run_id=run_id)
+    for fmt, status in exports.items():
+        if status["status"] == "ok":
+            print(f"Saved {fmt.upper()}: {status['path']}")
+        else:
+            print(f"Error saving {fmt.upper()}: {status['error']}")
+    return exports
+
+async def research_only(topic):
+    """Run only the research step for a topic and print what was found"""
+    from research import AsyncResearcher
+    from scheduler import close_browser_pool
+    
+    try:
+        results = await AsyncResearcher(topic)
+    finally:
+        await close_browser_pool()
+    for i, result in enumerate(results):
+        where = result.get("url") or ", ".join(result.get("urls", [])) or "(no url)"
+        print(f"{i+1}. [{result.get('kind', 'search')}] {result.get('title', '')} {where}")
+        print(f"   {' '.join(str(result.get('content', '')).split())[:200]}")
+    return results
+
+def list_runs():
+    """Print the stored run ids, newest first"""
+    from checkpoint import get_checkpointer
+    
+    for stored_run_id in get_checkpointer().list_runs():
+        print(stored_run_id)
 
-async def main(topic):
+def delete_run(run_id):
+    """Delete a stored run's checkpoints and release its research text from the store"""
+    from checkpoint import get_checkpointer
+    from store import get_research_store
+    
+    found = get_checkpointer().delete_run(run_id)
+    freed = get_research_store().release(run_id)
+    print(f"Deleted run {run_id}" if found else f"No stored run with id {run_id}", f"({freed} research blobs freed)")
+    return found
+
+async def main(topic, run_id=None):
     """Main function to run the research paper workflow"""
-    await run_research_paper_workflow(topic)
+    from scheduler import close_browser_pool
+    
+    try:
+        await run_research_paper_workflow(topic, run_id=run_id)
+    finally:
+        await close_browser_pool()
 
-if __name__ == "__main__":
+def prompt_topic():
+    """Ask for a research topic on the console"""
     # Allow user to input their research topic
     print("Enter a research topic (or press Enter for default):")
     user_input = input("> ").strip()
-    topic = user_input if user_input else "Making Diffusion Models Better"
-        
-    asyncio.run(main(topic))
\ No newline at end of file
+    return user_input if user_input else "Making Diffusion Models Better"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a research paper on a topic")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    run_parser = commands.add_parser("run", help="generate a paper (the default command)")
+    run_parser.add_argument("topic", nargs="?", help="research topic; asked for when omitted")
+    run_parser.add_argument("--resume", metavar="RUN_ID", help="resume a failed run from its last completed step")
+    research_parser = commands.add_parser("research", help="only research a topic and print the results")
+    research_parser.add_argument("topic", help="research topic")
+    render_parser = commands.add_parser("render", help="re-export a stored run without running anything")
+    render_parser.add_argument("run_id", help="id of the stored run")
+    render_parser.add_argument("--formats", nargs="+", default=["pdf"], choices=["pdf", "md", "html", "json"],
+                               help="formats to write (default: pdf)")
+    commands.add_parser("runs", help="list stored run ids, newest first")
+    delete_parser = commands.add_parser("delete", help="delete a stored run and the research only it refers to")
+    delete_parser.add_argument("run_id", help="id of the stored run")
+    regenerate_parser = commands.add_parser("regenerate", help="redraft only the sections of a stored run that changed")
+    regenerate_parser.add_argument("run_id", help="id of the stored run")
+    regenerate_parser.add_argument("--section", nargs="+", default=[], metavar="SECTION",
+                                   help="also redraft these sections, by number or part of the title")
+    regenerate_parser.add_argument("--research", nargs="+", default=[], metavar="ITEM",
+                                   help="research these aspects afresh first; sections they change are redrafted")
+    regenerate_parser.add_argument("--formats", nargs="+", default=["pdf"], choices=["pdf", "md", "html", "json"],
+                                   help="formats to write (default: pdf)")
+    serve_parser = commands.add_parser("serve", help="run the HTTP service that writes papers from a job queue")
+    serve_parser.add_argument("--host", help="address to listen on (default: SERVER_HOST or 127.0.0.1)")
+    serve_parser.add_argument("--port", type=int, help="port to listen on (default: SERVER_PORT or 8080)")
+    # The options from before the subcommands still work
+    parser.add_argument("--resume", metavar="RUN_ID", help=argparse.SUPPRESS)
+    parser.add_argument("--render", metavar="RUN_ID", help=argparse.SUPPRESS)
+    parser.add_argument("--list-runs", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--delete-run", metavar="RUN_ID", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.command == "runs" or args.list_runs:
+        list_runs()
+    elif args.command == "delete" or args.delete_run:
+        delete_run(args.run_id if args.command == "delete" else args.delete_run)
+    elif args.command == "render":
+        render_run(args.run_id, args.formats)
+    elif args.render:
+        render_run(args.render)
+    elif args.command == "regenerate":
+        asyncio.run(regenerate_run(args.run_id, args.section, args.research, args.formats))
+    elif args.command == "serve":
+        from server import serve
+        serve(args.host, args.port)
+    elif args.command == "research":
+        asyncio.run(research_only(args.topic))
+    elif getattr(args, "resume", None):
+        asyncio.run(main(None, run_id=args.resume))
+    else:
+        asyncio.run(main(getattr(args, "topic", None) or prompt_topic()))
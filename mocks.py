@@ -0,0 +1,171 @@
+"""Deterministic local stand-ins for Groq, Tavily and the browser agent.
+
+`install()` swaps them in so the whole workflow runs offline with configurable
+latency and payload sizes; benchmark.py uses it for end-to-end throughput runs.
+"""
+import time
+import random
+import asyncio
+import hashlib
+from typing import Any, Dict, List
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from synthetic import synthetic_text, synthetic_draft
+
+def _rng(*parts: Any) -> random.Random:
+    """Random generator seeded from its inputs, so equal prompts give equal output"""
+    return random.Random(hashlib.sha256(repr(parts).encode("utf-8")).hexdigest())
+
+def _slug(text: str) -> str:
+    return "-".join(text.lower().split()[:4]) or "topic"
+
+class MockChatModel(BaseChatModel):
+    """Chat model answering each workflow prompt with plausible text after a simulated delay.
+
+    The delay is `latency` seconds plus the output length at `tokens_per_second`.
+    """
+
+    latency: float = 0.05
+    tokens_per_second: float = 2000.0
+    draft_chars: int = 20000
+    seed: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "mock"
+
+    def respond(self, prompt: str) -> str:
+        rng = _rng(self.seed, prompt)
+        if "Shorten the provided idea" in prompt:
+            return " ".join(prompt.rsplit("Idea is :", 1)[-1].split()[:6])
+        if "specific aspects that need more detailed research" in prompt:
+            return "\n".join(f"{i + 1}. {synthetic_text(6, rng)}" for i in range(4))
+        if "outline" in prompt and ("create a detailed outline" in prompt or "Revise the outline" in prompt):
+            return "\n".join(f"## {i + 1}. {synthetic_text(4, rng)}\n- {synthetic_text(8, rng)}\n- {synthetic_text(8, rng)}"
+                             for i in range(5))
+        if "Write only the section" in prompt:
+            title = prompt.split('Write only the section "', 1)[1].split('"', 1)[0]
+            return f"## {title}\n\n{synthetic_text(self.draft_chars // 30, rng)}"
+        # A synthetic draft page is about 3000 characters
+        return synthetic_draft(max(1, self.draft_chars // 3000), rng)
+
+    def _result(self, messages: List[Any]) -> ChatResult:
+        prompt = "\n".join(str(message.content) for message in messages)
+        text = self.respond(prompt)
+        message = AIMessage(content=text, usage_metadata={
+            "input_tokens": len(prompt) // 4, "output_tokens": len(text) // 4,
+            "total_tokens": (len(prompt) + len(text)) // 4,
+        })
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _delay(self, result: ChatResult) -> float:
+        return self.latency + result.generations[0].message.usage_metadata["output_tokens"] / self.tokens_per_second
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        result = self._result(messages)
+        time.sleep(self._delay(result))
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        result = self._result(messages)
+        await asyncio.sleep(self._delay(result))
+        return result
+
+class MockTavilyClient:
+    """TavilyClient stand-in returning `results` hits of `result_chars` characters after `latency` seconds"""
+
+    def __init__(self, latency: float = 0.2, results: int = 5, result_chars: int = 2000, seed: int = 0):
+        self.latency = latency
+        self.results = results
+        self.result_chars = result_chars
+        self.seed = seed
+
+    def search(self, query: str, max_results: int = 5, **kwargs: Any) -> Dict[str, Any]:
+        time.sleep(self.latency)
+        rng = _rng(self.seed, "tavily", query)
+        return {"query": query, "results": [{
+            "url": f"https://search.example/{_slug(query)}/{i}",
+            "title": synthetic_text(6, rng),
+            "content": synthetic_text(self.result_chars // 6, rng),
+            "score": 1.0 - i / 10,
+        } for i in range(min(max_results, self.results))]}
+
+class MockBrowser:
+    """Stand-in for browser_use.Browser and BrowserContext; nothing to launch or close"""
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        pass
+
+    async def close(self) -> None:
+        pass
+
+def make_mock_agent(latency: float = 1.0, pages: int = 2, page_chars: int = 3000, seed: int = 0):
+    """Return a browser_use.Agent stand-in whose run() produces a real AgentHistoryList.
+
+    Each run visits a search page, extracts text from `pages` pages and finishes
+    with an answer, taking `latency` seconds.
+    """
+    from browser_use.agent.views import AgentBrain, AgentHistory, AgentHistoryList, AgentOutput, ActionResult
+    from browser_use.browser.views import BrowserStateHistory
+    from browser_use.controller.service import Controller
+
+    action_model = Controller().registry.create_action_model()
+    output_model = AgentOutput.type_with_custom_actions(action_model)
+    brain = AgentBrain(evaluation_previous_goal="", memory="", next_goal="")
+
+    def step(url: str, title: str, action: Dict[str, Any], result: ActionResult) -> AgentHistory:
+        return AgentHistory(
+            model_output=output_model(current_state=brain, action=[action_model(**action)]),
+            result=[result],
+            state=BrowserStateHistory(url=url, title=title, tabs=[], interacted_element=[None], screenshot=None),
+        )
+
+    class MockAgent:
+        def __init__(self, task: str, llm: Any = None, browser_context: Any = None, **kwargs: Any):
+            self.task = task
+            self.state = type("State", (), {"history": AgentHistoryList(history=[])})()
+
+        async def run(self, max_steps: int = 100) -> AgentHistoryList:
+            rng = _rng(seed, "browser", self.task)
+            slug = _slug(self.task.split(":", 1)[-1])
+            history = self.state.history.history
+            history.append(step(f"https://www.google.com/search?q={slug}", "Search",
+                                {"search_google": {"query": slug}},
+                                ActionResult(extracted_content=f"Searched for {slug}", include_in_memory=True)))
+            for i in range(pages):
+                await asyncio.sleep(latency / (pages + 1))
+                history.append(step(f"https://pages.example/{slug}/{i}", synthetic_text(5, rng),
+                                    {"extract_content": {"goal": "findings"}},
+                                    ActionResult(extracted_content="Extracted from page\n: " +
+                                                 synthetic_text(page_chars // 6, rng), include_in_memory=True)))
+            await asyncio.sleep(latency / (pages + 1))
+            answer = synthetic_text(120, rng)
+            history.append(step(f"https://pages.example/{slug}/{pages - 1}", "Done",
+                                {"done": {"text": answer, "success": True}},
+                                ActionResult(is_done=True, extracted_content=answer, include_in_memory=True)))
+            return self.state.history
+
+    return MockAgent
+
+def install(llm_latency: float = 0.05, tokens_per_second: float = 2000.0, draft_chars: int = 20000,
+            tavily_latency: float = 0.2, result_chars: int = 2000, browser_latency: float = 1.0,
+            pages: int = 2, page_chars: int = 3000, seed: int = 0) -> None:
+    """Replace the Groq models, the Tavily client and the browser agent with local stand-ins"""
+    import browser_use
+    import browser_use.browser.context
+    import clients
+    import research
+    from cache import CachedChatModel
+
+    model = MockChatModel(latency=llm_latency, tokens_per_second=tokens_per_second, draft_chars=draft_chars, seed=seed)
+    clients._chat_models[True] = CachedChatModel(model)
+    clients._chat_models[False] = model
+    # The Tavily gate stays in place so its bookkeeping is part of the measurement, without a rate limit
+    clients.tavily_gate.requests.per_minute = 0
+    research._tavily_client = clients.GatedTavilyClient(MockTavilyClient(tavily_latency, 5, result_chars, seed))
+    browser_use.Agent = make_mock_agent(browser_latency, pages, page_chars, seed)
+    browser_use.Browser = MockBrowser
+    browser_use.browser.context.BrowserContext = MockBrowser
@@ -1,12 +1,29 @@
-from typing import TypedDict, List, Dict, Any
+import operator
+from typing import TypedDict, List, Dict, Any, Annotated
+
+# One piece of research: a search hit ("search"), text the browser agent extracted
+# from a page ("page"), a browser agent's final answer ("answer", citing the pages in urls),
+# or chunks found by an earlier run and reused from the knowledge base ("knowledge")
+class ResearchResult(TypedDict, total=False):
+    url: str
+    urls: List[str]
+    title: str
+    content: str
+    outline_item: str
+    kind: str
 
 # Define the state for our research paper workflow
+# Nodes return only the keys they change; intermediate_steps are appended rather than replaced,
+# and research_results hold content ids into the research store instead of the text itself
 class ReportState(TypedDict):
     system_prompt: str
     topic: str
     outline: str
     draft: str
     sources: List[str]
-    intermediate_steps: List[str]
+    intermediate_steps: Annotated[List[str], operator.add]
     research_results: List[Dict[str, Any]]
-    score: List[Any]
\ No newline at end of file
+    # Drafted sections ({"title", "fingerprint", "text"}) in outline order; the fingerprint
+    # identifies the prompt a section was written from, so unchanged sections can be reused
+    sections: List[Dict[str, str]]
+    score: List[Any]
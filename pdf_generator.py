@@ -1,146 +1,272 @@
 import re
 from datetime import datetime
+from typing import Any, Dict, List, NamedTuple
 from fpdf import FPDF
 import unicodedata
 import os
 
+# Replace common Unicode characters with ASCII equivalents
+_REPLACEMENTS = {
+    '\u2014': '--',  # em dash
+    '\u2013': '-',   # en dash
+    '\u2018': "'",   # left single quote
+    '\u2019': "'",   # right single quote
+    '\u201c': '"',   # left double quote
+    '\u201d': '"',   # right double quote
+    '\u2022': '*',   # bullet
+    '\u2026': '...',  # ellipsis
+    '\u00a0': ' ',    # non-breaking space
+}
+
+class _AsciiTable(dict):
+    """str.translate table that fills itself in as new characters are seen.
+
+    ASCII characters map to themselves; any other character maps to the ASCII
+    part of its NFKD decomposition, computed once and memoized.
+    """
+
+    def __missing__(self, codepoint):
+        char = chr(codepoint)
+        if codepoint < 128:
+            value = char
+        else:
+            value = unicodedata.normalize('NFKD', char).encode('ascii', 'ignore').decode('ascii', 'ignore')
+        self[codepoint] = value
+        return value
+
+_ASCII_TABLE = _AsciiTable({ord(char): ascii_char for char, ascii_char in _REPLACEMENTS.items()})
+_NON_ASCII_RUN = re.compile(r'[^\x00-\x7f]+')
+
+def _translate_run(match):
+    return match.group().translate(_ASCII_TABLE)
+
 def normalize_text(text):
     """Replace Unicode characters with ASCII equivalents or remove them if not possible"""
     if not text:
         return ""
-    # Replace common Unicode characters with ASCII equivalents
-    replacements = {
-        '\u2014': '--',  # em dash
-        '\u2013': '-',   # en dash
-        '\u2018': "'",   # left single quote
-        '\u2019': "'",   # right single quote
-        '\u201c': '"',   # left double quote
-        '\u201d': '"',   # right double quote
-        '\u2022': '*',   # bullet
-        '\u2026': '...',  # ellipsis
-        '\u00a0': ' ',    # non-breaking space
-    }
+    # Pure ASCII text needs no translation
+    if text.isascii():
+        return text
+    # Single pass: ASCII stretches are copied as-is, only non-ASCII runs go through the table
+    return _NON_ASCII_RUN.sub(_translate_run, text)
+
+# A parsed markdown block. kind is one of: heading, numbered, bullet, line, code,
+# table or break (the end of a paragraph); level is the heading level or list indent
+class Block(NamedTuple):
+    kind: str
+    level: int
+    text: str
+
+_HEADING_RE = re.compile(r'^(#+)\s+(.+)$')
+_NUMBERED_RE = re.compile(r"^[IVX]+\.|^\d+\.")
+_BULLET_RE = re.compile(r'^(\s*)[-*+]\s+(.*)$')
+_TABLE_SEPARATOR_RE = re.compile(r'^\|?[\s:|-]*-{3,}[\s:|-]*$')
+
+def parse_markdown(text: str) -> List[Block]:
+    """Parse markdown text into a flat list of blocks in a single pass over its lines"""
+    blocks: List[Block] = []
+    code_lines = None
+    for line in text.split("\n"):
+        stripped = line.strip()
+        # Inside a fenced code block everything up to the closing fence is code
+        if code_lines is not None:
+            if stripped.startswith("```"):
+                blocks.append(Block("code", 0, "\n".join(code_lines)))
+                code_lines = None
+            else:
+                code_lines.append(line.rstrip())
+            continue
+        if stripped.startswith("```"):
+            code_lines = []
+            continue
+        
+        if not stripped:
+            # Runs of blank lines end a paragraph once
+            if blocks and blocks[-1].kind != "break":
+                blocks.append(Block("break", 0, ""))
+            continue
+        
+        heading_match = _HEADING_RE.match(stripped)
+        if heading_match:
+            blocks.append(Block("heading", len(heading_match.group(1)), heading_match.group(2).strip()))
+        elif _NUMBERED_RE.match(stripped):
+            blocks.append(Block("numbered", 0, stripped))
+        elif stripped.startswith("|"):
+            if not _TABLE_SEPARATOR_RE.match(stripped):
+                row = " | ".join(cell.strip() for cell in stripped.strip("|").split("|"))
+                # Consecutive table rows form one table block
+                if blocks and blocks[-1].kind == "table":
+                    blocks[-1] = Block("table", 0, blocks[-1].text + "\n" + row)
+                else:
+                    blocks.append(Block("table", 0, row))
+        else:
+            bullet_match = _BULLET_RE.match(line)
+            if bullet_match:
+                blocks.append(Block("bullet", len(bullet_match.group(1).expandtabs(4)) // 2, bullet_match.group(2)))
+            else:
+                blocks.append(Block("line", 0, line.rstrip()))
+    if code_lines is not None:
+        blocks.append(Block("code", 0, "\n".join(code_lines)))
+    return blocks
+
+# Layout of the outline: compact headings, every line kept as written
+OUTLINE_STYLE = {
+    "heading_sizes": {1: 14, 2: 13},
+    "heading_space_before": {},
+    "heading_space_after": {},
+    "numbered_space_after": 0,
+    "paragraph_space": 6,
+}
+# Layout of the paper body: larger headings with spacing around them and between paragraphs
+DRAFT_STYLE = {
+    "heading_sizes": {1: 16, 2: 14},
+    "heading_space_before": {1: 5, 2: 4, 3: 3},
+    "heading_space_after": {1: 3, 2: 2, 3: 2},
+    "numbered_space_after": 2,
+    "paragraph_space": 5,
+}
+
+class _FontState:
+    """Track the selected font so set_font is only called when it actually changes,
+    and memoize word widths per font for line wrapping"""
+
+    def __init__(self, pdf: FPDF):
+        self.pdf = pdf
+        self.current = None
+        self._widths: Dict[Any, Dict[str, float]] = {}
+
+    def use(self, family: str, style: str, size: int) -> None:
+        font = (family, style, size)
+        if font != self.current:
+            self.pdf.set_font(family, style, size)
+            self.current = font
+
+    def measure(self, text: str) -> float:
+        """Width of text in user units in the current font"""
+        char_widths = self.pdf.current_font['cw']
+        return sum(char_widths.get(char, 0) for char in text) * self.pdf.font_size / 1000.0
+
+    def width(self, word: str) -> float:
+        """Memoized width of a word in the current font"""
+        widths = self._widths.setdefault(self.current, {})
+        width = widths.get(word)
+        if width is None:
+            width = widths[word] = self.measure(word)
+        return width
+
+    def wrap(self, text: str, max_width: float) -> List[str]:
+        """Greedily break text into lines no wider than max_width, keeping explicit line breaks"""
+        space = self.width(" ")
+        lines = []
+        for paragraph in text.split("\n"):
+            words: List[str] = []
+            line_width = 0.0
+            for word in paragraph.split(" "):
+                word_width = self.width(word)
+                if words and line_width + space + word_width > max_width:
+                    lines.append(" ".join(words))
+                    words, line_width = [], 0.0
+                # Words wider than a whole line are split at the longest prefix that fits
+                while word_width > max_width and len(word) > 1:
+                    low, high = 1, len(word) - 1
+                    while low < high:
+                        middle = (low + high + 1) // 2
+                        if self.measure(word[:middle]) <= max_width:
+                            low = middle
+                        else:
+                            high = middle - 1
+                    lines.append(word[:low])
+                    word = word[low:]
+                    word_width = self.width(word)
+                line_width += (space if words else 0.0) + word_width
+                words.append(word)
+            lines.append(" ".join(words))
+        return lines
+
+def _write(pdf: FPDF, fonts: _FontState, height: float, text: str, indent: float = 0) -> None:
+    """Write wrapped text one line cell at a time from the left margin plus indent"""
+    x = pdf.l_margin + indent
+    max_width = pdf.w - pdf.r_margin - x - 2 * pdf.c_margin
+    for line in fonts.wrap(text, max_width):
+        pdf.set_x(x)
+        pdf.cell(0, height, line, ln=1)
+
+def render_blocks(pdf: FPDF, blocks: List[Block], style: Dict[str, Any], fonts: _FontState) -> None:
+    """Lay out parsed blocks on the PDF with the given style"""
+    for block in blocks:
+        if block.kind == "heading":
+            fonts.use("Arial", "B", style["heading_sizes"].get(block.level, 12))
+            level = min(block.level, 3)
+            before = style["heading_space_before"].get(level, 0)
+            after = style["heading_space_after"].get(level, 0)
+            if before:
+                pdf.ln(before)
+            _write(pdf, fonts, 8, block.text)
+            if after:
+                pdf.ln(after)
+        elif block.kind == "numbered":
+            fonts.use("Arial", "B", 12)
+            _write(pdf, fonts, 8, block.text)
+            if style["numbered_space_after"]:
+                pdf.ln(style["numbered_space_after"])
+        elif block.kind == "bullet":
+            fonts.use("Arial", "", 12)
+            _write(pdf, fonts, 6, f"- {block.text}", indent=5 * block.level)
+        elif block.kind in ("code", "table"):
+            fonts.use("Courier", "", 10)
+            _write(pdf, fonts, 5, block.text)
+        elif block.kind == "break":
+            pdf.ln(style["paragraph_space"])
+        else:
+            fonts.use("Arial", "", 12)
+            _write(pdf, fonts, 6, block.text)
+
+def build_report_pdf(result, current_date: str) -> FPDF:
+    """Lay out the title, outline, paper and sources of a report on a new PDF"""
+    # Create PDF object
+    pdf = FPDF()
+    pdf.add_page()
+    fonts = _FontState(pdf)
+    
+    # Title
+    fonts.use("Arial", "B", 16)
+    pdf.cell(0, 10, normalize_text(result["topic"]), ln=True, align="C")
+    pdf.ln(10)
     
-    for unicode_char, ascii_char in replacements.items():
-        text = text.replace(unicode_char, ascii_char)
+    # Date
+    fonts.use("Arial", "I", 10)
+    pdf.cell(0, 5, f"Generated on: {current_date}", ln=True)
+    pdf.ln(10)
     
-    # For any remaining non-ASCII characters, try to normalize or replace them
-    return ''.join(c if ord(c) < 128 else unicodedata.normalize('NFKD', c).encode('ascii', 'ignore').decode('ascii', 'ignore') for c in text)
+    # Outline
+    fonts.use("Arial", "B", 14)
+    pdf.cell(0, 10, "Outline", ln=True)
+    pdf.ln(5)
+    render_blocks(pdf, parse_markdown(normalize_text(result["outline"])), OUTLINE_STYLE, fonts)
+    pdf.ln(10)
+    
+    # Draft (main content)
+    fonts.use("Arial", "B", 14)
+    pdf.cell(0, 10, "Research Paper", ln=True)
+    pdf.ln(5)
+    render_blocks(pdf, parse_markdown(normalize_text(result["draft"])), DRAFT_STYLE, fonts)
+    
+    # Sources
+    pdf.ln(10)
+    fonts.use("Arial", "B", 14)
+    pdf.cell(0, 10, "Sources", ln=True)
+    pdf.ln(5)
+    
+    fonts.use("Arial", "", 12)
+    for i, source in enumerate(result["sources"][:20]):  # Limit to 20 sources
+        _write(pdf, fonts, 6, f"{i+1}. {normalize_text(source)}")
+    return pdf
 
 def save_report_as_pdf(result):
-    """Save the research paper as a PDF file"""
+    """Save the research paper as a PDF file and return its path, or None if saving failed"""
     try:
-        # Create PDF object
-        pdf = FPDF()
-        pdf.add_page()
-        
-        # Set font
-        pdf.set_font("Arial", "B", 16)
-        
-        # Title
-        pdf.cell(0, 10, normalize_text(result["topic"]), ln=True, align="C")
-        pdf.ln(10)
-        
-        # Date
-        pdf.set_font("Arial", "I", 10)
         current_date = datetime.now().strftime("%Y-%m-%d")
-        pdf.cell(0, 5, f"Generated on: {current_date}", ln=True)
-        pdf.ln(10)
-        
-        # Outline
-        pdf.set_font("Arial", "B", 14)
-        pdf.cell(0, 10, "Outline", ln=True)
-        pdf.ln(5)
-        
-        pdf.set_font("Arial", "", 12)
-        # Split outline into lines and add to PDF
-        outline_lines = normalize_text(result["outline"]).split("\n")
-        for line in outline_lines:
-            # Check for markdown headings (# Heading)
-            heading_match = re.match(r'^(#+)\s+(.+)$', line)
-            if heading_match:
-                # Get heading level (number of #)
-                heading_level = len(heading_match.group(1))
-                heading_text = heading_match.group(2).strip()
-                
-                # Apply different formatting based on heading level
-                if heading_level == 1:  # H1
-                    pdf.set_font("Arial", "B", 14)
-                    pdf.cell(0, 8, heading_text, ln=True)
-                elif heading_level == 2:  # H2
-                    pdf.set_font("Arial", "B", 13)
-                    pdf.cell(0, 8, heading_text, ln=True)
-                else:  # H3 and beyond
-                    pdf.set_font("Arial", "B", 12)
-                    pdf.cell(0, 8, heading_text, ln=True)
-                
-                pdf.set_font("Arial", "", 12)  # Reset font
-            # Check if line is a numbered or Roman numeral heading
-            elif re.match(r"^[IVX]+\.|^\d+\.", line.strip()):
-                pdf.set_font("Arial", "B", 12)
-                pdf.cell(0, 8, line, ln=True)
-                pdf.set_font("Arial", "", 12)
-            else:
-                pdf.cell(0, 6, line, ln=True)
-        
-        pdf.ln(10)
-        
-        # Draft (main content)
-        pdf.set_font("Arial", "B", 14)
-        pdf.cell(0, 10, "Research Paper", ln=True)
-        pdf.ln(5)
-        
-        pdf.set_font("Arial", "", 12)
-        # Split draft into paragraphs and add to PDF
-        paragraphs = re.split(r'\n\s*\n', normalize_text(result["draft"]))
-        for paragraph in paragraphs:
-            # Check if paragraph is a heading
-            lines = paragraph.split("\n")
-            for line in lines:
-                # Check for markdown headings (# Heading)
-                heading_match = re.match(r'^(#+)\s+(.+)$', line)
-                if heading_match:
-                    # Get heading level (number of #)
-                    heading_level = len(heading_match.group(1))
-                    heading_text = heading_match.group(2).strip()
-                    
-                    # Apply different formatting based on heading level
-                    if heading_level == 1:  # H1
-                        pdf.set_font("Arial", "B", 16)
-                        pdf.ln(5)
-                        pdf.multi_cell(0, 8, heading_text)
-                        pdf.ln(3)
-                    elif heading_level == 2:  # H2
-                        pdf.set_font("Arial", "B", 14)
-                        pdf.ln(4)
-                        pdf.multi_cell(0, 8, heading_text)
-                        pdf.ln(2)
-                    else:  # H3 and beyond
-                        pdf.set_font("Arial", "B", 12)
-                        pdf.ln(3)
-                        pdf.multi_cell(0, 8, heading_text)
-                        pdf.ln(2)
-                    
-                    pdf.set_font("Arial", "", 12)  # Reset font
-                # Check for numbered or roman numeral headings
-                elif re.match(r"^[IVX]+\.|^\d+\.", line.strip()):
-                    pdf.set_font("Arial", "B", 12)
-                    pdf.multi_cell(0, 8, line.strip())
-                    pdf.ln(2)
-                    pdf.set_font("Arial", "", 12)
-                else:
-                    pdf.multi_cell(0, 6, line)
-            pdf.ln(5)
-        
-        # Sources
-        pdf.ln(10)
-        pdf.set_font("Arial", "B", 14)
-        pdf.cell(0, 10, "Sources", ln=True)
-        pdf.ln(5)
-        
-        pdf.set_font("Arial", "", 12)
-        for i, source in enumerate(result["sources"][:20]):  # Limit to 20 sources
-            pdf.multi_cell(0, 6, f"{i+1}. {normalize_text(source)}")
+        pdf = build_report_pdf(result, current_date)
         
         # Generate filename based on topic and date
         safe_topic = re.sub(r'[^\w\s-]', '', result["topic"]).strip().replace(' ', '_')
@@ -149,8 +275,7 @@ def save_report_as_pdf(result):
         home_dir = os.path.expanduser("~")
         # Create a directory for reports if it doesn't exist
         reports_dir = os.path.join(home_dir, "research_papers")
-        if not os.path.exists(reports_dir):
-            os.makedirs(reports_dir)
+        os.makedirs(reports_dir, exist_ok=True)
         
         # Create the full path to the file
         filename = os.path.join(reports_dir, f"research_paper_{safe_topic}_{current_date}.pdf")
@@ -158,6 +283,8 @@ def save_report_as_pdf(result):
         # Save PDF
         pdf.output(filename)
         print(f"\nResearch paper saved as PDF: {filename}")
+        return filename
         
     except Exception as e:
-        print(f"Error saving PDF: {str(e)}")
\ No newline at end of file
+        print(f"Error saving PDF: {str(e)}")
+        return None
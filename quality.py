@@ -0,0 +1,90 @@
+import os
+from typing import Any, Dict, List
+from urllib.parse import urlparse
+
+from context import split_chunks, tokenize
+
+# Set to 0 to run every paper through the full pipeline without scoring its research
+QUALITY_GATE = os.getenv("QUALITY_GATE", "1").lower() in ("1", "true", "yes")
+# Scores below QUALITY_WEAK trigger a targeted extra search; scores from QUALITY_STRONG up
+# let browser tasks be skipped for aspects the research already covers
+QUALITY_WEAK = float(os.getenv("QUALITY_WEAK", "0.5"))
+QUALITY_STRONG = float(os.getenv("QUALITY_STRONG", "0.8"))
+# Share of a query's keywords the research must contain for the query to count as covered
+QUALITY_COVERAGE = float(os.getenv("QUALITY_COVERAGE", "0.8"))
+# Distinct sites needed for full source diversity
+QUALITY_MIN_SOURCES = int(os.getenv("QUALITY_MIN_SOURCES", "5"))
+# Targeted searches run at most for one weak score
+QUALITY_EXTRA_SEARCHES = int(os.getenv("QUALITY_EXTRA_SEARCHES", "3"))
+# Chunks whose words are pooled when checking a query's coverage
+_COVERAGE_CHUNKS = 3
+# Words per shingle, and the share of a chunk's shingles seen before that makes it a duplicate
+_SHINGLE_WORDS = 5
+_DUPLICATE_SHARE = 0.8
+
+def result_domains(results: List[Dict[str, Any]]) -> List[str]:
+    """Distinct sites the research came from, in order of first appearance"""
+    domains = []
+    for result in results:
+        for url in [result.get("url", "")] + result.get("urls", []):
+            domain = urlparse(url).netloc.lower().removeprefix("www.") if "://" in url else ""
+            if domain and domain not in domains:
+                domains.append(domain)
+    return domains
+
+def query_coverage(query: str, chunk_terms: List[set]) -> float:
+    """Share of query's keywords found in the few chunks that match it best"""
+    terms = set(tokenize(query))
+    if not terms:
+        return 1.0
+    best = sorted(chunk_terms, key=lambda words: -len(terms & words))[:_COVERAGE_CHUNKS]
+    found = set().union(*best) & terms
+    return len(found) / len(terms)
+
+def duplication(chunks: List[str]) -> float:
+    """Share of chunks that mostly repeat text from earlier chunks"""
+    seen = set()
+    duplicates = 0
+    for chunk in chunks:
+        words = chunk.lower().split()
+        shingles = {" ".join(words[i:i + _SHINGLE_WORDS]) for i in range(max(1, len(words) - _SHINGLE_WORDS + 1))}
+        if len(shingles & seen) >= _DUPLICATE_SHARE * len(shingles):
+            duplicates += 1
+        seen |= shingles
+    return duplicates / len(chunks) if chunks else 0.0
+
+def verdict(score: float) -> str:
+    """Classify a combined score as weak, ok or strong"""
+    if score < QUALITY_WEAK:
+        return "weak"
+    return "strong" if score >= QUALITY_STRONG else "ok"
+
+def score_research(results: List[Dict[str, Any]], queries: List[str], stage: str = "research") -> Dict[str, Any]:
+    """Score research for the given queries without calling any model.
+
+    Coverage is the mean share of each query's keywords found in the research,
+    duplication the share of repeated chunks and diversity the number of distinct
+    sites relative to QUALITY_MIN_SOURCES. The score weighs coverage by half and
+    the other two by a quarter each; gaps are the indices of uncovered queries.
+    """
+    chunks = [chunk for result in results for chunk in split_chunks(str(result.get("content", "")))]
+    chunk_terms = [set(tokenize(chunk)) for chunk in chunks]
+    coverages = [query_coverage(query, chunk_terms) for query in queries]
+    coverage = sum(coverages) / len(coverages) if coverages else 0.0
+    repeated = duplication(chunks)
+    diversity = min(1.0, len(result_domains(results)) / max(1, QUALITY_MIN_SOURCES))
+    score = 0.5 * coverage + 0.25 * (1 - repeated) + 0.25 * diversity if chunks else 0.0
+    return {
+        "stage": stage,
+        "score": round(score, 3),
+        "verdict": verdict(score),
+        "coverage": round(coverage, 3),
+        "duplication": round(repeated, 3),
+        "diversity": round(diversity, 3),
+        "gaps": [i for i, value in enumerate(coverages) if value < QUALITY_COVERAGE],
+    }
+
+def describe_score(entry: Dict[str, Any]) -> str:
+    """One-line summary of a score entry for the console and intermediate steps"""
+    return (f"Scored {entry['stage']}: {entry['score']:.2f} ({entry['verdict']}; coverage {entry['coverage']:.2f}, "
+            f"duplication {entry['duplication']:.2f}, diversity {entry['diversity']:.2f})")
@@ -1,107 +1,271 @@
 import os
-import json
 import asyncio
 import re
-from typing import List, Dict, Any
-from tavily import TavilyClient
-from browser_use import Agent
-from langchain.tools import Tool
+from typing import AsyncIterator, List, Dict, Any, Optional
 
-# Import the LLM models that will be used for research
-from langchain_groq import ChatGroq
+# Import the LLM models that will be used for research; they are created on first use
+from clients import get_chat_model, GatedTavilyClient
+from models import ResearchResult
+from cache import SEARCH_CACHE_BYPASS, get_search_cache, dedupe_results
+from knowledge import KNOWLEDGE_BASE, get_knowledge_base
+from quality import QUALITY_GATE, score_research, describe_score
+from instrumentation import span, research_bytes
+from scheduler import (BROWSER_TASK_TIMEOUT, BROWSER_RESEARCH_TIMEOUT, get_browser_pool,
+                       close_browser_pool, remaining_time, completed_with_deadline)
 
-# Initialize LLM models
-llm = ChatGroq(model="deepseek-r1-distill-llama-70b", reasoning_format="hidden")
-llm1 = ChatGroq(model="deepseek-r1-distill-llama-70b", reasoning_format="hidden")
+class BrowserTaskTimeout(TimeoutError):
+    """A browser task ran out of time; history holds what the agent did before the deadline"""
+
+    def __init__(self, history, timeout: float):
+        super().__init__(f"browser task timed out after {timeout:.1f}s")
+        self.history = history
 
 # Create a function that will use the browser agent
-async def use_browser_search(query):
+async def use_browser_search(query, browser_context=None, timeout=None):
+    """Run the browser agent on query; raises BrowserTaskTimeout with the partial history after timeout seconds"""
+    from browser_use import Agent
+    
     agent = Agent(
         task=query,
-        llm=llm,
+        llm=get_chat_model(cached=False),
+        browser_context=browser_context,
     )
-    result = await agent.run()
+    try:
+        result = await asyncio.wait_for(agent.run(), timeout)
+    except asyncio.TimeoutError:
+        # Keep whatever the agent found before the deadline, but let the caller know its pages were left mid-task
+        print(f"Browser task timed out after {timeout:.1f}s, using partial results")
+        raise BrowserTaskTimeout(agent.state.history, timeout)
     return result
 
-# Create a tool that wraps the browser search functionality
-browser_search = Tool(
-    name="browser_search",
-    description="Search the web for information using a browser",
-    func=lambda query: asyncio.run(use_browser_search(query))
-)
+def __getattr__(name: str) -> Any:
+    """Build the LLM clients (llm, llm1) and the browser_search tool only when first accessed"""
+    if name == "llm":
+        # llm drives the browser agent, which needs the full chat model interface, so it is not cached
+        return get_chat_model(cached=False)
+    if name == "llm1":
+        return get_chat_model()
+    if name == "browser_search":
+        from langchain.tools import Tool
+        
+        # Create a tool that wraps the browser search functionality
+        return Tool(
+            name="browser_search",
+            description="Search the web for information using a browser",
+            func=lambda query: asyncio.run(use_browser_search(query))
+        )
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# A single Tavily client is shared by every search in the process
+_tavily_client = None
+
+def get_tavily_client() -> GatedTavilyClient:
+    """Return the shared, rate-limited Tavily client, creating it on first use"""
+    global _tavily_client
+    if _tavily_client is None:
+        from tavily import TavilyClient
+        
+        _tavily_client = GatedTavilyClient(TavilyClient(api_key=os.getenv('TAVILY_API_KEY')))
+    return _tavily_client
 
 # Function to perform research using Tavily
-def TavilyResearcher(question: str) -> List[Dict[str, Any]]:
+async def AsyncTavilyResearcher(question: str) -> List[ResearchResult]:
     """
     This function performs a search using Tavily and returns the results as a list of dictionaries.
+    It shares the caller's event loop: the LLM call is awaited and the blocking Tavily
+    request runs in a worker thread.
     """
     try:
-        tavily = TavilyClient(api_key=os.getenv('TAVILY_API_KEY'))
-        print(f"Using Tavily API key: ")  # Print first few chars for debugging
-        
         # Get keywords from the question
-        result = llm1.invoke(f"Shorten the provided idea to only include a few keywords related to it : only return a few keywords to search for and nothing else. Idea is : {question}")
+        result = await get_chat_model().ainvoke(f"Shorten the provided idea to only include a few keywords related to it : only return a few keywords to search for and nothing else. Idea is : {question}")
         keywords = result.content
         print(f"Search keywords: {keywords}")
         
-        # For advanced search with simplified parameters
-        response = tavily.search(
+        return await tavily_search(keywords)
+    except Exception as e:
+        # Continue with browser research alone; AsyncResearcher fails if that finds nothing either
+        print(f"Tavily search failed after retries, continuing with browser search only: {type(e).__name__}: {str(e)}")
+        return []
+
+async def tavily_search(keywords: str, exclude_domains: Optional[List[str]] = None) -> List[ResearchResult]:
+    """Search Tavily for keywords, serving repeated and near-identical searches from the local result store"""
+    tavily = get_tavily_client()
+    cache_key = keywords if not exclude_domains else f"{keywords} -site:{' -site:'.join(exclude_domains)}"
+    cached_context = None if SEARCH_CACHE_BYPASS else get_search_cache().get("tavily", cache_key)
+    if cached_context is not None:
+        print("Using cached Tavily results")
+        return cached_context
+    
+    # For advanced search with simplified parameters
+    options = {"exclude_domains": exclude_domains} if exclude_domains else {}
+    with span("tavily_search", "search", query=keywords) as attrs:
+        response = await asyncio.to_thread(
+            tavily.search,
             query=keywords,
             search_depth="basic",  # Try basic first to ensure it works
-            max_results=5  # Reduce to minimize potential issues
+            max_results=5,  # Reduce to minimize potential issues
+            **options
         )
         
         # Get the search results as context
-        context = [{"url": obj["url"], "content": obj["content"]} for obj in response["results"]]
-        return context
+        context = [{"url": obj["url"], "title": obj.get("title", ""), "content": obj["content"], "kind": "search"}
+                   for obj in response["results"]]
+        attrs["results"] = len(context)
+        attrs["bytes"] = research_bytes(context)
+    get_search_cache().put("tavily", cache_key, context)
+    return context
+
+async def targeted_search(query, exclude_domains=None) -> List[ResearchResult]:
+    """Extra Tavily search filling a gap found by the quality score; a failed search yields no results"""
+    try:
+        results = await tavily_search(query, exclude_domains)
     except Exception as e:
-        print(f"Tavily search error: {type(e).__name__}: {str(e)}")
-        # Return empty results on error so the workflow can continue
-        return [{"url": "error", "content": f"Error performing Tavily search: {str(e)}. Continuing with browser search only."}]
+        print(f"Targeted search for {query!r} failed: {type(e).__name__}: {str(e)}")
+        return []
+    await remember_research(results, query)
+    return results
+
+def TavilyResearcher(question: str) -> List[ResearchResult]:
+    """Synchronous wrapper around AsyncTavilyResearcher for callers without an event loop"""
+    return asyncio.run(AsyncTavilyResearcher(question))
+
+# Pages that only list search hits, or are blank, are not sources
+_SEARCH_PAGE = re.compile(r"^(about:|chrome:|data:)|^https?://(www\.)?(google\.[a-z.]+/search|bing\.com/search|duckduckgo\.com/|search\.yahoo\.com/)")
+# Prefix browser_use puts in front of text taken from a page
+_EXTRACTED_PREFIX = re.compile(r"^\W*Extracted from page\s*:?\s*\n?\s*:?\s*")
+
+def extract_browser_findings(history, item: str) -> List[ResearchResult]:
+    """Turn a browser agent history into research records.
+
+    Text the agent extracted from each page becomes a "page" record under that
+    page's URL, and the final answer of a finished run an "answer" record listing
+    the pages visited. Navigation, clicks and other bookkeeping are dropped.
+    """
+    pages: Dict[str, ResearchResult] = {}
+    visited: List[str] = []
+    for step in history.history:
+        url = step.state.url if step.state else None
+        is_source = bool(url) and not _SEARCH_PAGE.match(url)
+        if is_source and url not in visited:
+            visited.append(url)
+        actions = step.model_output.action if step.model_output else []
+        for action, action_result in zip(actions, step.result):
+            name = next(iter(action.model_dump(exclude_unset=True)), "")
+            if name != "extract_content" or not action_result.extracted_content:
+                continue
+            text = _EXTRACTED_PREFIX.sub("", action_result.extracted_content).strip()
+            # Text read off a search results page has no page of its own to cite
+            page_url = url if is_source else ""
+            page = pages.setdefault(page_url, {"url": page_url, "title": step.state.title if is_source else "",
+                                               "content": "", "outline_item": item, "kind": "page"})
+            page["content"] = f"{page['content']}\n\n{text}".strip()
+    findings: List[ResearchResult] = [page for page in pages.values() if page["content"]]
+    # An unfinished run's last result is whatever its last action returned, not an answer
+    answer = history.final_result() if history.is_done() else None
+    if answer and answer.strip():
+        findings.insert(0, {"url": "", "urls": visited, "title": item, "content": answer.strip(),
+                            "outline_item": item, "kind": "answer"})
+    return findings
 
 # Function to perform research using browser search
-async def async_browser_search(query, item, i):
-    """Run a single browser search asynchronously"""
+async def async_browser_search(topic, item, i, deadline=None, use_cache=True) -> List[ResearchResult]:
+    """Research one aspect of topic with the browser agent on a pooled browser context.
+
+    The task is limited to BROWSER_TASK_TIMEOUT seconds and never runs past the
+    loop-time deadline shared by all tasks of the paper. A failed task yields no results.
+    """
     try:
-        print(f"\nStarting research task {i+1}: {item}")
-        item_results = await use_browser_search(query)
-        
-        # Process results
-        result = {
-            "content": str(item_results),
-            "url": f"browser_search_result_{i+1}",
-            "outline_item": item
-        }
+        # Browser runs are the most expensive calls, so reuse a fresh result for the same aspect of the same topic
+        cache_key = f"{topic}: {item}"
+        cached_results = None if SEARCH_CACHE_BYPASS or not use_cache else get_search_cache().get("browser_findings", cache_key)
+        if cached_results is not None:
+            print(f"\nUsing cached research for task {i+1}: {item}")
+            return cached_results
         
-        # Try to parse JSON if possible
-        if isinstance(item_results, str):
-            try:
-                parsed_results = json.loads(item_results)
-                if isinstance(parsed_results, list):
-                    for r in parsed_results:
-                        r['outline_item'] = item
-                    return parsed_results
-            except json.JSONDecodeError:
-                pass
+        try:
+            async with get_browser_pool().context() as browser_context:
+                # Time spent waiting for a free slot counts against the shared deadline
+                timeout = remaining_time(deadline, BROWSER_TASK_TIMEOUT)
+                if timeout <= 0:
+                    raise TimeoutError("research deadline reached before the task could start")
+                print(f"\nStarting research task {i+1}: {item}")
+                timed_out = None
+                with span("browser_task", "browser", item=item) as attrs:
+                    try:
+                        history = await use_browser_search(aspect_task(topic, item), browser_context, timeout)
+                    except BrowserTaskTimeout as e:
+                        history, timed_out = e.history, e
+                    findings = extract_browser_findings(history, item)
+                    attrs["raw_bytes"] = len(str(history).encode("utf-8"))
+                    attrs["bytes"] = research_bytes(findings)
+                    attrs["prompt_tokens"] = history.total_input_tokens()
+                    attrs["steps"] = len(history.history)
+                    attrs["finished"] = history.is_done()
+                # Leaving the pool with the timeout makes it close the context instead of reusing it
+                if timed_out is not None:
+                    raise timed_out
+        except BrowserTaskTimeout:
+            pass
         
-        print(f"Completed research task {i+1}: {item}")
-        return [result]
+        print(f"Completed research task {i+1}: {item} ({len(findings)} findings)")
+        # Partial histories from timed-out runs are used once but not cached
+        if history.is_done():
+            get_search_cache().put("browser_findings", cache_key, findings)
+        return findings
     except Exception as e:
-        print(f"Error researching outline item {i+1}: {str(e)}")
-        return [{
-            "content": f"Error researching: {str(e)}",
-            "url": f"browser_search_error_{i+1}",
-            "outline_item": item
-        }]
+        print(f"Error researching outline item {i+1}: {type(e).__name__}: {str(e)}")
+        return []
 
-async def gather_results(tasks):
-    """Gather results from multiple async tasks"""
-    return await asyncio.gather(*tasks)
+async def lookup_knowledge(query, item=None) -> List[ResearchResult]:
+    """Return past research from the knowledge base that covers query, or [] if it needs a fresh search"""
+    if not KNOWLEDGE_BASE or SEARCH_CACHE_BYPASS:
+        return []
+    try:
+        with span("knowledge_lookup", "search", query=query) as attrs:
+            found = await asyncio.to_thread(get_knowledge_base().lookup, query, item)
+            attrs["results"] = len(found)
+            attrs["bytes"] = research_bytes(found)
+        return found
+    except Exception as e:
+        print(f"Knowledge base lookup failed, searching instead: {type(e).__name__}: {str(e)}")
+        return []
 
-def Researcher(query):
-    """Use Tavily for initial research and browser search for detailed information"""
-    # First use Tavily to get initial research
-    tavily_results = TavilyResearcher(query)
+async def remember_research(results, topic) -> None:
+    """Add fresh research to the knowledge base for later topics"""
+    if not KNOWLEDGE_BASE or not results:
+        return
+    try:
+        await asyncio.to_thread(get_knowledge_base().add_results, results, topic)
+    except Exception as e:
+        print(f"Could not add research to the knowledge base: {type(e).__name__}: {str(e)}")
+
+def aspect_task(query, item) -> str:
+    """Browser agent task researching one aspect of a topic"""
+    return f"Research the following specific aspect of {query}: {item}. Do a brief research in 3 steps at most"
+
+async def research_outline_item(query, item) -> List[ResearchResult]:
+    """Research one aspect of a topic afresh with the browser agent, e.g. to update a finished paper"""
+    deadline = asyncio.get_running_loop().time() + BROWSER_TASK_TIMEOUT
+    results = await async_browser_search(query, item, 0, deadline, use_cache=False)
+    await remember_research(results, query)
+    return results
+
+async def stream_research(query) -> AsyncIterator[List[ResearchResult]]:
+    """Yield research in batches as it arrives: the Tavily results first, then
+    the findings of each browser task as soon as that task completes.
+
+    The knowledge base of earlier runs is checked first: the Tavily search is
+    skipped when it already covers the topic, and browser tasks only run for the
+    aspects it does not cover. Browser tasks still running when the caller stops
+    iterating are cancelled.
+    """
+    # First use Tavily to get initial research, unless past research already covers the topic
+    tavily_results = await lookup_knowledge(query)
+    if tavily_results:
+        print(f"Using {len(tavily_results)} findings from the knowledge base for: {query}")
+    else:
+        tavily_results = await AsyncTavilyResearcher(query)
+    yield tavily_results
     
     # Generate an outline based on Tavily results
     outline_content = ""
@@ -120,7 +284,7 @@ def Researcher(query):
     3. Neural networks business applications
     """
     
-    outline_response = llm1.invoke(outline_prompt)
+    outline_response = await get_chat_model().ainvoke(outline_prompt)
     research_outline = outline_response.content
     
     # Parse the outline into separate tasks
@@ -143,20 +307,60 @@ def Researcher(query):
     for i, item in enumerate(outline_items):
         print(f"{i+1}. {item}")
     
-    # Execute browser search for each outline item simultaneously
-    combined_results = tavily_results.copy()
+    # Aspects the knowledge base already covers need no browser task
+    known_results = []
+    missing_items = []
+    for i, item in enumerate(outline_items):
+        item_results = await lookup_knowledge(f"{query} {item}", item)
+        if item_results:
+            print(f"Found research task {i+1} in the knowledge base: {item}")
+            known_results.extend(item_results)
+        else:
+            missing_items.append((i, item))
+    if known_results:
+        yield known_results
+    # Only index this run's Tavily results now, so they cannot make its own aspects look covered
+    await remember_research(tavily_results, query)
+    
+    # When the research so far already scores strong, browser tasks only run for the aspects it misses
+    if QUALITY_GATE and missing_items:
+        # Aspects are scored on their own keywords; every result about the topic has the topic's
+        entry = score_research(tavily_results + known_results, [item for _, item in missing_items])
+        if entry["verdict"] == "strong":
+            gaps = [missing_items[i] for i in entry["gaps"]]
+            print(f"{describe_score(entry)}; skipping {len(missing_items) - len(gaps)} browser task(s)")
+            missing_items = gaps
     
-    # Create search queries for each outline item
+    # Create search queries for each remaining outline item, all sharing one deadline
+    deadline = asyncio.get_running_loop().time() + BROWSER_RESEARCH_TIMEOUT
     search_tasks = []
-    for i, item in enumerate(outline_items):
-        search_query = f"Research the following specific aspect of {query}: {item}. Do a brief research in 3 steps at most"
-        search_tasks.append(async_browser_search(search_query, item, i))
+    for i, item in missing_items:
+        search_tasks.append(async_browser_search(query, item, i, deadline))
     
-    # Run all searches in parallel and wait for all to complete
-    all_results = asyncio.run(gather_results(search_tasks))
+    # Run the searches with bounded parallelism and hand over each one's findings as it finishes;
+    # tasks stop themselves at the deadline, and anything still running after a short grace period is cancelled
+    async for item_results in completed_with_deadline(search_tasks, BROWSER_RESEARCH_TIMEOUT + 30):
+        await remember_research(item_results, query)
+        yield item_results
+
+async def AsyncResearcher(query):
+    """Use Tavily for initial research and browser search for detailed information"""
+    combined_results = []
+    async for results in stream_research(query):
+        combined_results.extend(results)
     
-    # Combine all results
-    for result_list in all_results:
-        combined_results.extend(result_list)
+    # Never write a paper without any grounding
+    if not combined_results:
+        raise RuntimeError(f"No research results for {query!r}: Tavily and every browser task failed")
     
-    return combined_results
\ No newline at end of file
+    # Drop duplicate URLs and content across Tavily and browser results
+    return dedupe_results(combined_results)
+
+def Researcher(query):
+    """Synchronous wrapper around AsyncResearcher for callers without an event loop"""
+    async def run_and_close():
+        try:
+            return await AsyncResearcher(query)
+        finally:
+            await close_browser_pool()
+    return asyncio.run(run_and_close())
@@ -0,0 +1,106 @@
+import os
+import asyncio
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Dict, List, Optional
+
+if TYPE_CHECKING:
+    # browser_use is slow to import, so it is only loaded once a browser is needed
+    from browser_use import Browser
+    from browser_use.browser.context import BrowserContext
+
+# Maximum number of browser agents running at the same time
+MAX_PARALLEL_AGENTS = int(os.getenv("MAX_PARALLEL_AGENTS", "3"))
+# Seconds a single browser research task may run before its partial history is used
+BROWSER_TASK_TIMEOUT = float(os.getenv("BROWSER_TASK_TIMEOUT", "300"))
+# Seconds all browser research tasks of one paper may take together
+BROWSER_RESEARCH_TIMEOUT = float(os.getenv("BROWSER_RESEARCH_TIMEOUT", "900"))
+
+class BrowserPool:
+    """Share one browser between agents and hand out reusable browser contexts.
+
+    At most `size` contexts are in use at once, which bounds the number of
+    browser agents running in parallel.
+    """
+
+    def __init__(self, size: int = MAX_PARALLEL_AGENTS):
+        self.size = max(1, size)
+        self._semaphore = asyncio.Semaphore(self.size)
+        self._browser: Optional["Browser"] = None
+        self._idle: List["BrowserContext"] = []
+
+    @asynccontextmanager
+    async def context(self):
+        """Wait for a free slot and yield a browser context from the pool.
+
+        A context whose task failed, timed out or was cancelled is closed rather than reused,
+        since its pages may be left in an unknown state.
+        """
+        from browser_use import Browser
+        from browser_use.browser.context import BrowserContext
+        
+        async with self._semaphore:
+            if self._browser is None:
+                self._browser = Browser()
+            browser_context = self._idle.pop() if self._idle else BrowserContext(browser=self._browser)
+            try:
+                yield browser_context
+            except BaseException:
+                await browser_context.close()
+                raise
+            self._idle.append(browser_context)
+
+    async def close(self) -> None:
+        """Close every pooled context and the shared browser"""
+        while self._idle:
+            await self._idle.pop().close()
+        if self._browser is not None:
+            await self._browser.close()
+            self._browser = None
+
+# Browsers and semaphores belong to one event loop, so each loop gets its own pool
+_browser_pools: Dict[asyncio.AbstractEventLoop, BrowserPool] = {}
+
+def get_browser_pool() -> BrowserPool:
+    """Return the browser pool of the running event loop, creating it on first use"""
+    loop = asyncio.get_running_loop()
+    for stale_loop in [l for l in _browser_pools if l.is_closed()]:
+        del _browser_pools[stale_loop]
+    if loop not in _browser_pools:
+        _browser_pools[loop] = BrowserPool()
+    return _browser_pools[loop]
+
+async def close_browser_pool() -> None:
+    """Close the running event loop's browser pool, if one was created"""
+    pool = _browser_pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.close()
+
+def remaining_time(deadline: Optional[float], timeout: float) -> float:
+    """Return timeout capped by the seconds left until the loop-time deadline"""
+    if deadline is None:
+        return timeout
+    return min(timeout, deadline - asyncio.get_running_loop().time())
+
+async def completed_with_deadline(tasks: List[Awaitable[Any]], timeout: float) -> AsyncIterator[Any]:
+    """Run tasks concurrently and yield each result as soon as its task finishes.
+
+    Failed tasks are skipped. Tasks still running at the deadline, or when the
+    caller stops iterating, are cancelled.
+    """
+    pending = {asyncio.ensure_future(task) for task in tasks}
+    deadline = asyncio.get_running_loop().time() + timeout
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=remaining_time(deadline, timeout),
+                                               return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                print(f"Research deadline reached, cancelled {len(pending)} unfinished task(s)")
+                break
+            for future in done:
+                if future.exception() is None:
+                    yield future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,253 @@
+"""HTTP service writing papers from a priority job queue.
+
+Run `python main.py serve`. One process keeps a single compiled workflow, the
+LLM and search clients and the browser pool warm for every job.
+"""
+import os
+import time
+import asyncio
+import itertools
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from aiohttp import web
+
+from main import create_initial_state
+from workflow import create_research_paper_workflow
+from export import export_report
+from clients import get_chat_model
+from research import get_tavily_client
+from scheduler import close_browser_pool
+from checkpoint import RUNS_DIR, new_run_id, run_config
+from instrumentation import trace_run, span
+from context import load_encoding
+
+# Address the service listens on; keep it on localhost unless it sits behind an authenticating proxy
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8080"))
+# Papers generated at the same time
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "2"))
+# Jobs allowed to wait in the queue; further submissions are refused until it drains
+SERVER_QUEUE_SIZE = int(os.getenv("SERVER_QUEUE_SIZE", "100"))
+# Seconds finished jobs stay listed, and how many of them are kept at most; their files stay on disk
+SERVER_JOB_RETENTION = float(os.getenv("SERVER_JOB_RETENTION", "86400"))
+SERVER_MAX_FINISHED_JOBS = int(os.getenv("SERVER_MAX_FINISHED_JOBS", "1000"))
+# Jobs returned per page by GET /jobs, by default and at most
+_PAGE_SIZE = 50
+_MAX_PAGE_SIZE = 500
+
+class JobQueue:
+    """Bounded queue of paper jobs, served highest priority first and in submission order within a priority"""
+
+    def __init__(self, research_workflow, workers: int = SERVER_WORKERS, maxsize: int = SERVER_QUEUE_SIZE,
+                 retention: float = SERVER_JOB_RETENTION, max_finished: int = SERVER_MAX_FINISHED_JOBS):
+        self.research_workflow = research_workflow
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.retention = retention
+        self.max_finished = max_finished
+        # Finished job ids with the monotonic time they finished, oldest first
+        self._finished: deque = deque()
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue(maxsize=maxsize)
+        self._order = itertools.count()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(max(1, workers))]
+        # Progress is the share of graph nodes completed; conditional edges may skip some of them
+        self.total_nodes = len([node for node in research_workflow.get_graph().nodes if not node.startswith("__")])
+
+    def submit(self, topic: str, priority: int = 0) -> Dict[str, Any]:
+        """Queue a paper on topic; raises asyncio.QueueFull when the queue is at capacity"""
+        job_id = new_run_id()
+        job = {
+            "id": job_id,
+            "topic": topic,
+            "priority": priority,
+            "status": "queued",
+            "steps": [],
+            "progress": 0.0,
+            "submitted_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        self._evict()
+        if self._queue.full():
+            self._drop_cancelled()
+        self._queue.put_nowait((-priority, next(self._order), job_id))
+        self.jobs[job_id] = job
+        return job
+    
+    def _drop_cancelled(self) -> None:
+        """Take entries of jobs that will never run out of the queue, so they do not use up its capacity"""
+        entries = [self._queue.get_nowait() for _ in range(self._queue.qsize())]
+        for entry in entries:
+            self._queue.task_done()
+            job = self.jobs.get(entry[2])
+            if job is not None and job["status"] == "queued":
+                self._queue.put_nowait(entry)
+    
+    def _finish(self, job: Dict[str, Any]) -> None:
+        job["finished_at"] = datetime.now().isoformat(timespec="seconds")
+        self._finished.append((time.monotonic(), job["id"]))
+        self._evict()
+    
+    def _evict(self) -> None:
+        """Forget finished jobs past the retention period or beyond the count limit, oldest first"""
+        expired = time.monotonic() - self.retention
+        while self._finished and (self._finished[0][0] < expired or len(self._finished) > self.max_finished):
+            _, job_id = self._finished.popleft()
+            self.jobs.pop(job_id, None)
+    
+    def page(self, offset: int = 0, limit: int = _PAGE_SIZE, status: Optional[str] = None) -> Dict[str, Any]:
+        """Newest jobs first, without their steps and sources, optionally only those with a status"""
+        self._evict()
+        jobs = [job for job in reversed(self.jobs.values()) if status is None or job["status"] == status]
+        summaries = [{key: value for key, value in job.items() if key not in ("steps", "sources")}
+                     for job in jobs[offset:offset + limit]]
+        return {"jobs": summaries, "total": len(jobs), "offset": offset, "limit": limit}
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a job that has not started yet"""
+        job = self.jobs.get(job_id)
+        if job is None or job["status"] != "queued":
+            return False
+        job["status"] = "cancelled"
+        self._finish(job)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for job in self.jobs.values():
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return {"queued": counts.get("queued", 0), "capacity": self._queue.maxsize, "workers": len(self._workers),
+                "jobs": counts}
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, job_id = await self._queue.get()
+            try:
+                # Cancelled jobs may already have been forgotten
+                job = self.jobs.get(job_id)
+                if job is not None and job["status"] == "queued":
+                    await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        """Generate one paper, updating the job's status and progress as each node finishes"""
+        job["status"] = "running"
+        job["started_at"] = datetime.now().isoformat(timespec="seconds")
+        start = time.monotonic()
+        config = run_config(job["id"])
+        trace = None
+        completed_nodes = 0
+        try:
+            with trace_run(job["id"]) as trace:
+                # Stream node updates so progress follows the intermediate steps as they are recorded
+                async for update in self.research_workflow.astream(create_initial_state(job["topic"]), config,
+                                                                   stream_mode="updates"):
+                    for node_update in update.values():
+                        job["steps"].extend((node_update or {}).get("intermediate_steps", []))
+                        completed_nodes += 1
+                    job["progress"] = round(min(1.0, completed_nodes / self.total_nodes), 2)
+                result = (await self.research_workflow.aget_state(config)).values
+                with span("export", "export"):
+                    exports = await export_report(result, run_id=job["id"])
+            failed = [fmt for fmt, status in exports.items() if status["status"] != "ok"]
+            # Nodes skipped by conditional edges never report, so a finished job is complete whatever the count
+            job.update({"status": "done" if not failed else "error", "exports": exports, "sources": result["sources"],
+                        "progress": 1.0})
+            if failed:
+                job["error"] = "; ".join(f"{fmt}: {exports[fmt]['error']}" for fmt in failed)
+        except Exception as e:
+            print(f"An error occurred for topic {job['topic']!r}: {type(e).__name__}: {str(e)}")
+            job.update({"status": "error", "error": f"{type(e).__name__}: {str(e)}"})
+        finally:
+            if trace is not None:
+                job["report"] = trace.write(os.path.join(RUNS_DIR, job["id"]))
+            job["duration_seconds"] = round(time.monotonic() - start, 2)
+            self._finish(job)
+
+    async def close(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+
+def _job_queue(request: web.Request) -> JobQueue:
+    return request.app["job_queue"]
+
+def _find_job(request: web.Request) -> Dict[str, Any]:
+    job = _job_queue(request).jobs.get(request.match_info["job_id"])
+    if job is None:
+        raise web.HTTPNotFound(text="unknown job\n")
+    return job
+
+async def submit_job(request: web.Request) -> web.Response:
+    """POST /jobs with {"topic": ..., "priority": 0}; higher priorities run first"""
+    try:
+        body = await request.json()
+        topic = str(body["topic"]).strip()
+        priority = int(body.get("priority", 0))
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise web.HTTPBadRequest(text='expected a JSON object with a "topic" and an optional integer "priority"\n')
+    if not topic:
+        raise web.HTTPBadRequest(text="topic is empty\n")
+    try:
+        job = _job_queue(request).submit(topic, priority)
+    except asyncio.QueueFull:
+        raise web.HTTPServiceUnavailable(text="job queue is full, try again later\n", headers={"Retry-After": "60"})
+    return web.json_response(job, status=202, headers={"Location": f"/jobs/{job['id']}"})
+
+async def list_jobs(request: web.Request) -> web.Response:
+    """GET /jobs?offset=0&limit=50&status=done; newest first, details at /jobs/{id}"""
+    try:
+        offset = max(0, int(request.query.get("offset", 0)))
+        limit = min(_MAX_PAGE_SIZE, max(1, int(request.query.get("limit", _PAGE_SIZE))))
+    except ValueError:
+        raise web.HTTPBadRequest(text="offset and limit must be integers\n")
+    return web.json_response(_job_queue(request).page(offset, limit, request.query.get("status")))
+
+async def get_job(request: web.Request) -> web.Response:
+    return web.json_response(_find_job(request))
+
+async def cancel_job(request: web.Request) -> web.Response:
+    job = _find_job(request)
+    if not _job_queue(request).cancel(job["id"]):
+        raise web.HTTPConflict(text=f"job is {job['status']} and can no longer be cancelled\n")
+    return web.json_response(job)
+
+async def download_pdf(request: web.Request) -> web.StreamResponse:
+    job = _find_job(request)
+    pdf = job.get("exports", {}).get("pdf", {})
+    if pdf.get("status") != "ok":
+        raise web.HTTPConflict(text=f"job is {job['status']} and has no PDF\n")
+    return web.FileResponse(pdf["path"], headers={
+        "Content-Disposition": f'attachment; filename="{os.path.basename(pdf["path"])}"'
+    })
+
+async def health(request: web.Request) -> web.Response:
+    return web.json_response(_job_queue(request).stats())
+
+def create_app(research_workflow=None, workers: int = SERVER_WORKERS, queue_size: int = SERVER_QUEUE_SIZE) -> web.Application:
+    """Build the web application; its job queue and workers start with the app and stop with it"""
+    app = web.Application()
+
+    async def lifecycle(app: web.Application):
+        # Create the shared clients up front so the first job does not pay for them
+        get_chat_model()
+        get_chat_model(cached=False)
+        get_tavily_client()
+        await asyncio.to_thread(load_encoding)
+        app["job_queue"] = JobQueue(research_workflow or create_research_paper_workflow(), workers, queue_size)
+        yield
+        await app["job_queue"].close()
+        await close_browser_pool()
+
+    app.cleanup_ctx.append(lifecycle)
+    app.router.add_post("/jobs", submit_job)
+    app.router.add_get("/jobs", list_jobs)
+    app.router.add_get("/jobs/{job_id}", get_job)
+    app.router.add_delete("/jobs/{job_id}", cancel_job)
+    app.router.add_get("/jobs/{job_id}/pdf", download_pdf)
+    app.router.add_get("/health", health)
+    return app
+
+def serve(host: Optional[str] = None, port: Optional[int] = None) -> None:
+    """Run the service until interrupted"""
+    web.run_app(create_app(), host=host or SERVER_HOST, port=port or SERVER_PORT)
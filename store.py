@@ -0,0 +1,113 @@
+import os
+import zlib
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, Iterable, List
+
+from cache import CACHE_DIR
+
+class ResearchStore:
+    """Content-addressed, compressed SQLite store for research text.
+
+    Workflow state (and so every checkpoint) keeps only a content id per result.
+    Identical text found by several runs is stored once, and each run holds a
+    reference to the blobs it uses; a blob is deleted when its last run releases it.
+    """
+
+    def __init__(self, path: str):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs (id TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS refs (run_id TEXT NOT NULL, id TEXT NOT NULL, PRIMARY KEY (run_id, id))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS refs_id ON refs (id)")
+        self._conn.commit()
+
+    def put(self, content: str, run_id: str) -> str:
+        """Store content for run_id and return its id; storing the same text again only adds a reference"""
+        data = content.encode("utf-8")
+        content_id = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO blobs (id, data, size) VALUES (?, ?, ?)",
+                (content_id, zlib.compress(data), len(data))
+            )
+            self._conn.execute("INSERT OR IGNORE INTO refs (run_id, id) VALUES (?, ?)", (run_id, content_id))
+            self._conn.commit()
+        return content_id
+
+    def get_many(self, content_ids: Iterable[str]) -> Dict[str, str]:
+        """Return the text of every known id"""
+        ids = list(dict.fromkeys(content_ids))
+        found = {}
+        with self._lock:
+            # Stay below SQLite's limit on query parameters
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT id, data FROM blobs WHERE id IN ({', '.join('?' * len(batch))})", batch
+                ).fetchall()
+                found.update((row[0], zlib.decompress(row[1]).decode("utf-8")) for row in rows)
+        return found
+
+    def get(self, content_id: str) -> str:
+        return self.get_many([content_id])[content_id]
+
+    def store_results(self, results: List[Dict[str, Any]], run_id: str) -> List[Dict[str, Any]]:
+        """Move the content of research results into the store, returning compact records"""
+        records = []
+        for result in results:
+            record = {key: value for key, value in result.items() if key != "content"}
+            content = str(result.get("content", ""))
+            record["content_id"] = self.put(content, run_id)
+            record["size"] = len(content.encode("utf-8"))
+            records.append(record)
+        return records
+
+    def load_results(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Return records with their content read back from the store.
+
+        Records that still carry their content (e.g. from runs made before the store) are returned as they are.
+        """
+        contents = self.get_many(r["content_id"] for r in records if "content_id" in r and "content" not in r)
+        results = []
+        for record in records:
+            if "content_id" in record and "content" not in record:
+                record = {**record, "content": contents.get(record["content_id"], "")}
+            results.append(record)
+        return results
+
+    def release(self, run_id: str) -> int:
+        """Drop every reference held by run_id and delete blobs no run refers to; returns the number deleted"""
+        with self._lock:
+            self._conn.execute("DELETE FROM refs WHERE run_id = ?", (run_id,))
+            deleted = self._conn.execute(
+                "DELETE FROM blobs WHERE NOT EXISTS (SELECT 1 FROM refs WHERE refs.id = blobs.id)"
+            ).rowcount
+            self._conn.commit()
+        return deleted
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the number of blobs and runs, and the raw and compressed size of the stored text"""
+        with self._lock:
+            blobs, size, stored = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(data)), 0) FROM blobs"
+            ).fetchone()
+            runs = self._conn.execute("SELECT COUNT(DISTINCT run_id) FROM refs").fetchone()[0]
+        return {"blobs": blobs, "runs": runs, "bytes": size, "stored_bytes": stored}
+
+_research_store = None
+
+def get_research_store() -> ResearchStore:
+    """Return the process-wide research store, creating it on first use"""
+    global _research_store
+    if _research_store is None:
+        _research_store = ResearchStore(os.path.join(CACHE_DIR, "research_store.sqlite3"))
+    return _research_store
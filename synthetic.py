@@ -0,0 +1,30 @@
+"""Deterministic synthetic research text and papers for the benchmarks and the mock providers"""
+import random
+
+_VOCABULARY = (
+    "diffusion model sampling guidance noise schedule latent training stability distillation "
+    "reinforcement learning policy reward agent planning memory benchmark evaluation dataset "
+    "transformer attention scaling efficiency inference quantization pruning teacher student"
+).split()
+
+def synthetic_text(words: int, rng: random.Random) -> str:
+    """Random sentences drawn from a small research vocabulary"""
+    sentences = []
+    while words > 0:
+        length = min(words, rng.randint(8, 20))
+        sentences.append(" ".join(rng.choice(_VOCABULARY) for _ in range(length)).capitalize() + ".")
+        words -= length
+    return " ".join(sentences)
+
+def synthetic_draft(pages: int, rng: random.Random) -> str:
+    """Markdown paper of roughly `pages` PDF pages with headings, lists, code and tables"""
+    parts = ["# Synthetic Paper"]
+    # About two sections of mixed blocks fill a page
+    for section in range(pages * 2):
+        parts.append(f"## {section + 1}. {synthetic_text(5, rng)}")
+        parts.append(synthetic_text(120, rng))
+        parts.append("\n".join(f"- {synthetic_text(10, rng)}" for _ in range(3)))
+        if section % 5 == 0:
+            parts.append("```\nfor step in range(steps):\n    x = denoise(x, step)\n```")
+            parts.append("| Method | Steps | FID |\n|---|---|---|\n| DDPM | 1000 | 3.2 |\n| DDIM | 50 | 4.1 |")
+    return "\n\n".join(parts)
@@ -0,0 +1,52 @@
+import asyncio
+import time
+
+from langchain_core.messages import AIMessage
+
+import clients
+from cache import CachedChatModel, LLMCache
+from workflow import generate_text
+
+class CountingModel:
+    """Chat model stand-in answering every call with a new numbered response"""
+
+    model_name = "counting"
+
+    def __init__(self):
+        self.calls = 0
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        self.calls += 1
+        return AIMessage(content=f"response {self.calls}")
+
+def ask(model, prompt="prompt"):
+    return asyncio.run(model.ainvoke(prompt)).content
+
+def test_repeated_prompt_is_answered_from_the_cache():
+    model = CountingModel()
+    cached = CachedChatModel(model, LLMCache(":memory:"), bypass=False)
+    assert ask(cached) == "response 1"
+    assert ask(cached) == "response 1" and model.calls == 1
+    assert ask(cached, "other prompt") == "response 2"
+
+def test_cached_response_expires_after_the_ttl():
+    model = CountingModel()
+    cached = CachedChatModel(model, LLMCache(":memory:", ttl=0.05), bypass=False)
+    ask(cached)
+    time.sleep(0.1)
+    assert ask(cached) == "response 2" and model.calls == 2
+
+def test_bypass_calls_the_model_but_still_stores_the_response():
+    model = CountingModel()
+    cached = CachedChatModel(model, LLMCache(":memory:"), bypass=False)
+    ask(cached)
+    assert ask(cached.bypassing()) == "response 2"
+    assert ask(cached) == "response 2" and model.calls == 2
+
+def test_fresh_generation_replaces_the_cached_response(monkeypatch):
+    model = CountingModel()
+    monkeypatch.setitem(clients._chat_models, True, CachedChatModel(model, LLMCache(":memory:"), bypass=False))
+    monkeypatch.setattr("workflow.STREAM_OUTPUT", False)
+    assert asyncio.run(generate_text("prompt", "section")) == "response 1"
+    assert asyncio.run(generate_text("prompt", "section", fresh=True)) == "response 2"
+    assert asyncio.run(generate_text("prompt", "section")) == "response 2" and model.calls == 2
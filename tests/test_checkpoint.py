@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+
+import workflow
+from checkpoint import FileCheckpointSaver, run_config
+from main import create_initial_state
+
+def test_interrupted_run_resumes_from_disk_without_repeating_research(tmp_path, monkeypatch):
+    calls = {"research": 0, "outline": 0}
+
+    async def research_topic(state, config=None):
+        calls["research"] += 1
+        return {"sources": ["https://example.org"], "intermediate_steps": ["Completed initial research"],
+                "research_results": []}
+
+    async def generate_outline(state, config=None):
+        calls["outline"] += 1
+        if calls["outline"] == 1:
+            raise RuntimeError("process died while writing the outline")
+        return {"outline": "1. Introduction", "intermediate_steps": ["Generated outline"]}
+
+    async def generate_draft(state, config=None):
+        return {"draft": f"Draft of {state['outline']}", "intermediate_steps": ["Generated draft"]}
+
+    monkeypatch.setattr(workflow, "OVERLAP_OUTLINE", False)
+    monkeypatch.setattr(workflow, "QUALITY_GATE", False)
+    monkeypatch.setattr(workflow, "research_topic", research_topic)
+    monkeypatch.setattr(workflow, "generate_outline", generate_outline)
+    monkeypatch.setattr(workflow, "generate_draft", generate_draft)
+    config = run_config("interrupted")
+
+    first = workflow.create_research_paper_workflow(FileCheckpointSaver(str(tmp_path)))
+    with pytest.raises(RuntimeError):
+        asyncio.run(first.ainvoke(create_initial_state("resumable topic"), config))
+
+    # A new process only has the run file to go on
+    resumed = workflow.create_research_paper_workflow(FileCheckpointSaver(str(tmp_path)))
+    result = asyncio.run(resumed.ainvoke(None, config))
+    assert calls == {"research": 1, "outline": 2}
+    assert result["draft"] == "Draft of 1. Introduction"
+    assert result["sources"] == ["https://example.org"]
@@ -0,0 +1,56 @@
+import pytest
+
+import clients
+from clients import CircuitBreaker, CircuitOpenError, ProviderGate, RetryableError, TokenBucket
+
+def test_queued_reservations_are_spaced_at_the_rate():
+    bucket = TokenBucket(30)
+    delays = [bucket.reserve() for _ in range(20)]
+    # The first capacity's worth go at once, every later caller waits two seconds more than the one before
+    burst = int(bucket.capacity)
+    assert delays[:burst] == [0.0] * burst
+    for earlier, later in zip(delays[burst - 1:], delays[burst:]):
+        assert later - earlier == pytest.approx(2.0, abs=0.01)
+    assert delays[-1] == pytest.approx((20 - bucket.capacity) * 2.0, abs=0.01)
+
+def make_gate(monkeypatch) -> ProviderGate:
+    monkeypatch.setattr(clients, "RETRY_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(clients, "RETRY_BASE_DELAY", 0.001)
+    gate = ProviderGate("Test", 0)
+    gate.breaker = CircuitBreaker("Test", threshold=1, reset_seconds=0.05)
+    return gate
+
+def failing(failures: int):
+    """Return a send() that fails with a retryable error `failures` times before succeeding"""
+    calls = []
+    def send():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise RetryableError("HTTP 503", 503)
+        return "ok"
+    return send
+
+def open_circuit(gate: ProviderGate) -> None:
+    with pytest.raises(RetryableError):
+        gate.call(failing(99))
+    assert gate.breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        gate.call(failing(0))
+
+def test_half_open_trial_retries_and_closes_the_circuit(monkeypatch):
+    gate = make_gate(monkeypatch)
+    open_circuit(gate)
+    clients.time.sleep(0.06)
+    assert gate.breaker.state == "half-open"
+    # The trial call fails twice and succeeds on its last attempt
+    assert gate.call(failing(2)) == "ok"
+    assert gate.breaker.state == "closed"
+
+def test_failed_half_open_trial_opens_the_circuit_again(monkeypatch):
+    gate = make_gate(monkeypatch)
+    open_circuit(gate)
+    clients.time.sleep(0.06)
+    # The trial's own error is raised after all its attempts, not CircuitOpenError
+    with pytest.raises(RetryableError):
+        gate.call(failing(99))
+    assert gate.breaker.state == "open"
@@ -0,0 +1,22 @@
+import sys
+import time
+import types
+
+import context
+
+def test_slow_tokenizer_load_falls_back_for_the_whole_process(monkeypatch):
+    # A tiktoken whose download hangs, as it can without a network timeout
+    def get_encoding(name):
+        time.sleep(0.5)
+        return object()
+    monkeypatch.setitem(sys.modules, "tiktoken", types.SimpleNamespace(get_encoding=get_encoding))
+    monkeypatch.setattr(context, "TOKENIZER_ENCODING", "cl100k_base")
+    monkeypatch.setattr(context, "_encoding", None)
+    monkeypatch.setattr(context, "_encoding_loaded", False)
+    
+    start = time.monotonic()
+    assert context.load_encoding(timeout=0.1) is None
+    assert time.monotonic() - start < 0.4
+    # The load finishing later does not switch this process to the tokenizer
+    time.sleep(0.6)
+    assert context.get_encoding() is None
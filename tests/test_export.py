@@ -0,0 +1,22 @@
+import asyncio
+
+from export import export_report
+
+def paper(draft: str) -> dict:
+    return {"topic": "Making Diffusion Models Better", "outline": "1. Introduction", "draft": draft,
+            "sources": ["https://example.org/a"]}
+
+def test_two_runs_of_one_topic_keep_their_own_files(tmp_path):
+    async def export_both():
+        first = await export_report(paper("First run"), ["md", "json"], str(tmp_path), "20260101-090000-aaaaaaaa")
+        second = await export_report(paper("Second run"), ["md", "json"], str(tmp_path), "20260101-100000-bbbbbbbb")
+        return first, second
+
+    first, second = asyncio.run(export_both())
+    for fmt in ("md", "json"):
+        assert first[fmt]["status"] == second[fmt]["status"] == "ok"
+        assert first[fmt]["path"] != second[fmt]["path"]
+    with open(first["md"]["path"], encoding="utf-8") as f:
+        assert "First run" in f.read()
+    with open(second["md"]["path"], encoding="utf-8") as f:
+        assert "Second run" in f.read()
@@ -0,0 +1,35 @@
+import os
+import sys
+import subprocess
+from typing import Dict
+
+import pytest
+
+# Import-time budgets for the CLI start-up paths, in milliseconds, and modules those paths must not load
+IMPORT_BUDGETS_MS = {"main": 250, "main, export, checkpoint": 1500}
+HEAVY_MODULES = ("browser_use", "langchain_groq", "tavily", "langgraph.graph", "langchain.tools")
+REPEAT = 3
+
+def import_times(modules: str) -> Dict[str, int]:
+    """Cumulative import time in microseconds of every module loaded by `import modules`, from `python -X importtime`"""
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {modules}"],
+                               cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                               capture_output=True, text=True, check=True)
+    # Lines read "import time: self [us] | cumulative | imported package", nested by indentation
+    imported = {}
+    for line in completed.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line and "cumulative" not in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            imported[name.strip()] = int(cumulative)
+    return imported
+
+@pytest.mark.parametrize("modules, budget_ms", IMPORT_BUDGETS_MS.items())
+def test_start_up_imports_stay_within_budget(modules, budget_ms):
+    timings = []
+    for _ in range(REPEAT):
+        imported = import_times(modules)
+        heavy = sorted(name for name in imported if name.startswith(HEAVY_MODULES))
+        assert not heavy, f"import {modules} loads {', '.join(heavy)}"
+        timings.append(sum(imported.get(name.strip(), 0) for name in modules.split(",")) / 1000)
+    # The best of a few runs, so a busy machine does not fail the budget
+    assert min(timings) <= budget_ms, f"import {modules} took {min(timings):.0f} ms, over its {budget_ms} ms budget"
@@ -0,0 +1,22 @@
+from knowledge import KnowledgeBase
+
+TOPIC = "diffusion models classifier free guidance sample quality"
+
+def snippet(i: int, extra: str = "") -> dict:
+    return {"url": f"https://example.org/{i}", "title": f"Result {i}", "kind": "search",
+            "content": f"Diffusion models with classifier free guidance improve sample quality, study {i}. {extra}"}
+
+def test_topic_results_do_not_cover_its_aspects():
+    kb = KnowledgeBase(":memory:")
+    kb.add_results([snippet(i) for i in range(5)], TOPIC)
+    # Every chunk has the topic's words, but none is about the aspect
+    assert kb.lookup(f"{TOPIC} guidance benchmarks", "guidance benchmarks") == []
+
+def test_aspect_covered_by_enough_chunks_on_it():
+    kb = KnowledgeBase(":memory:")
+    kb.add_results([snippet(i, f"Progressive distillation reduces sampling steps in variant {i}.") for i in range(5)],
+                   TOPIC)
+    records = kb.lookup(f"{TOPIC} distillation sampling steps", "distillation sampling steps")
+    assert len(records) == 5
+    assert all(record["kind"] == "knowledge" and record["outline_item"] == "distillation sampling steps"
+               for record in records)
@@ -0,0 +1,22 @@
+from quality import score_research
+
+def result(i: int, text: str) -> dict:
+    return {"url": f"https://site{i}.example/page", "content": text, "kind": "search"}
+
+def test_scores_coverage_duplication_and_diversity():
+    texts = ["Classifier free guidance trades diversity for sample quality in diffusion models.",
+             "Raising the guidance scale sharpens images but narrows the range of outputs.",
+             "Text to image systems use classifier free guidance with a scale around seven.",
+             "Guidance needs a second network pass per step, doubling the cost of sampling.",
+             "Dynamic thresholding keeps pixel values in range at high guidance scales."]
+    results = [result(i, text) for i, text in enumerate(texts)]
+    entry = score_research(results, ["classifier free guidance", "distillation sampling steps"])
+    assert entry["gaps"] == [1]
+    assert entry["coverage"] == round((1 + 1 / 3) / 2, 3)
+    assert entry["duplication"] == 0.0 and entry["diversity"] == 1.0
+
+def test_repeated_text_from_one_site_scores_weak():
+    text = "Diffusion models denoise a latent step by step under a noise schedule until an image emerges."
+    entry = score_research([result(0, text), result(0, text)], ["quantum error correction"])
+    assert entry["duplication"] == 0.5 and entry["diversity"] == 0.2
+    assert entry["verdict"] == "weak"
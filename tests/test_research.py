@@ -0,0 +1,86 @@
+import asyncio
+
+import mocks
+from cache import SearchCache
+from research import async_browser_search, extract_browser_findings
+from scheduler import BrowserPool
+
+def run_agent(timeout: float = None):
+    """History of a mock browser agent run, cut short after timeout seconds if given"""
+    agent = mocks.make_mock_agent(latency=0.3, pages=2)(task="Research the following specific aspect of x: guidance")
+
+    async def run():
+        try:
+            await asyncio.wait_for(agent.run(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return agent.state.history
+
+    return asyncio.run(run())
+
+def test_finished_run_yields_its_answer_and_pages():
+    history = run_agent()
+    assert history.is_done()
+    findings = extract_browser_findings(history, "guidance")
+    assert [finding["kind"] for finding in findings] == ["answer", "page", "page"]
+    assert findings[0]["urls"] == [finding["url"] for finding in findings[1:]]
+
+def test_unfinished_run_yields_only_extracted_pages():
+    # Stopped after the first page was read, before the agent answered
+    history = run_agent(timeout=0.15)
+    assert not history.is_done()
+    findings = extract_browser_findings(history, "guidance")
+    assert [finding["kind"] for finding in findings] == ["page"]
+
+def test_run_stopped_before_reading_a_page_yields_nothing():
+    # The last action only searched; its result is not an answer
+    history = run_agent(timeout=0.05)
+    assert history.final_result()
+    assert extract_browser_findings(history, "guidance") == []
+
+def use_mock_browser(monkeypatch, context_class=mocks.MockBrowser) -> BrowserPool:
+    """Run browser tasks with the mock agent on a one-context pool of context_class"""
+    import browser_use
+    import browser_use.browser.context
+    import clients
+
+    pool = BrowserPool(size=1)
+    monkeypatch.setattr(browser_use, "Agent", mocks.make_mock_agent(latency=0.3, pages=2))
+    monkeypatch.setattr(browser_use, "Browser", mocks.MockBrowser)
+    monkeypatch.setattr(browser_use.browser.context, "BrowserContext", context_class)
+    monkeypatch.setitem(clients._chat_models, False, mocks.MockChatModel())
+    monkeypatch.setattr("research.get_browser_pool", lambda: pool)
+    return pool
+
+def test_timed_out_task_context_is_closed_not_reused(monkeypatch):
+    class RecordingContext(mocks.MockBrowser):
+        closed = []
+
+        async def close(self) -> None:
+            self.closed.append(self)
+
+    pool = use_mock_browser(monkeypatch, RecordingContext)
+
+    async def run(timeout):
+        deadline = None if timeout is None else asyncio.get_running_loop().time() + timeout
+        return await async_browser_search("x", "guidance", 0, deadline, use_cache=False)
+
+    # A finished task hands its context back for the next one
+    assert len(asyncio.run(run(None))) == 3
+    assert len(pool._idle) == 1 and not RecordingContext.closed
+    # A timed-out task still yields its partial findings, but its context is closed
+    reused = pool._idle[0]
+    assert [finding["kind"] for finding in asyncio.run(run(0.15))] == ["page"]
+    assert pool._idle == [] and RecordingContext.closed == [reused]
+
+def test_cached_findings_are_reused_only_for_the_same_topic(monkeypatch):
+    use_mock_browser(monkeypatch)
+    search_cache = SearchCache(":memory:")
+    monkeypatch.setattr("research.get_search_cache", lambda: search_cache)
+    monkeypatch.setattr("research.SEARCH_CACHE_BYPASS", False)
+
+    first = asyncio.run(async_browser_search("protein folding", "evaluation benchmarks", 0))
+    assert asyncio.run(async_browser_search("protein folding", "evaluation benchmarks", 0)) == first
+    # The same aspect of another topic runs its own browser task
+    other = asyncio.run(async_browser_search("galaxy formation", "evaluation benchmarks", 0))
+    assert other and other != first
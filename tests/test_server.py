@@ -0,0 +1,74 @@
+import asyncio
+import types
+
+import pytest
+
+from server import JobQueue
+
+class FailingWorkflow:
+    """Workflow stand-in whose runs fail at once, so jobs finish without any provider"""
+
+    def get_graph(self):
+        return types.SimpleNamespace(nodes={"__start__": None, "draft_node": None, "__end__": None})
+
+    async def astream(self, *args, **kwargs):
+        raise RuntimeError("no providers in tests")
+        yield
+
+def test_finished_jobs_are_evicted_and_listed_by_page(tmp_path, monkeypatch):
+    monkeypatch.setattr("server.RUNS_DIR", str(tmp_path))
+
+    async def run():
+        queue = JobQueue(FailingWorkflow(), workers=1, maxsize=10, max_finished=3)
+        try:
+            for i in range(5):
+                queue.submit(f"topic {i}")
+            await queue._queue.join()
+            # Only the three most recently finished jobs are kept
+            assert [job["topic"] for job in queue.jobs.values()] == ["topic 2", "topic 3", "topic 4"]
+            page = queue.page(offset=1, limit=1)
+            assert page["total"] == 3 and [job["topic"] for job in page["jobs"]] == ["topic 3"]
+            assert "steps" not in page["jobs"][0]
+            assert queue.page(status="queued")["total"] == 0
+        finally:
+            await queue.close()
+
+    asyncio.run(run())
+
+def test_finished_jobs_expire_after_the_retention_period(tmp_path, monkeypatch):
+    monkeypatch.setattr("server.RUNS_DIR", str(tmp_path))
+
+    async def run():
+        queue = JobQueue(FailingWorkflow(), workers=1, maxsize=10, retention=0.05)
+        try:
+            job = queue.submit("expiring")
+            await queue._queue.join()
+            assert job["status"] == "error"
+            await asyncio.sleep(0.1)
+            assert queue.page()["total"] == 0 and job["id"] not in queue.jobs
+        finally:
+            await queue.close()
+
+    asyncio.run(run())
+
+def test_cancelled_jobs_free_their_place_in_the_queue(tmp_path, monkeypatch):
+    monkeypatch.setattr("server.RUNS_DIR", str(tmp_path))
+
+    async def run():
+        queue = JobQueue(FailingWorkflow(), workers=1, maxsize=2)
+        try:
+            # Workers only start once the test yields to the loop, so every job stays queued
+            first = queue.submit("first")
+            queue.submit("second")
+            with pytest.raises(asyncio.QueueFull):
+                queue.submit("rejected")
+            assert queue.cancel(first["id"])
+            assert queue.stats()["queued"] == 1
+            third = queue.submit("third")
+            assert queue.stats()["queued"] == 2
+            await queue._queue.join()
+            assert first["status"] == "cancelled" and third["status"] == "error"
+        finally:
+            await queue.close()
+
+    asyncio.run(run())
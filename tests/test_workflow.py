@@ -0,0 +1,43 @@
+import asyncio
+import random
+
+import clients
+import mocks
+import workflow
+from cache import CachedChatModel, LLMCache
+from store import ResearchStore
+from synthetic import synthetic_text
+
+OUTLINE = "## Alpha methods\n- alpha gradients\n## Beta results\n- beta posteriors"
+
+def test_only_sections_whose_research_changed_are_redrafted(monkeypatch):
+    monkeypatch.setitem(clients._chat_models, True,
+                        CachedChatModel(mocks.MockChatModel(latency=0), LLMCache(":memory:"), bypass=False))
+    monkeypatch.setattr("store._research_store", ResearchStore(":memory:"))
+    monkeypatch.setattr(workflow, "STREAM_OUTPUT", False)
+
+    # More research than fits one section's budget, so each section gets the chunks that match it best
+    rng = random.Random(0)
+    research = [{"title": f"Page {i}", "url": f"https://pages.example/{i}", "content": synthetic_text(400, rng)}
+                for i in range(6)]
+    state = {"topic": "Synthetic topic", "outline": OUTLINE, "sources": workflow.collect_sources(research),
+             "research_results": research, "sections": []}
+
+    async def research_outline_item(topic, item):
+        return [{"title": "Beta page", "url": "https://beta.example", "content": "Beta posteriors. " * 20}]
+
+    monkeypatch.setattr(workflow, "research_outline_item", research_outline_item)
+
+    first, titles = asyncio.run(workflow.regenerate_draft(state))
+    assert titles == ["Alpha methods", "Beta results"]
+    state = {**state, **first}
+
+    # Nothing changed, so both stored sections are reused
+    unchanged, titles = asyncio.run(workflow.regenerate_draft(state))
+    assert titles == [] and unchanged["sections"] == first["sections"]
+
+    # New research on beta changes only the beta section's prompt
+    update, titles = asyncio.run(workflow.regenerate_draft(state, research_items=["beta posteriors"]))
+    assert titles == ["Beta results"]
+    assert update["sections"][0] == first["sections"][0]
+    assert update["sections"][1]["fingerprint"] != first["sections"][1]["fingerprint"]
@@ -1,86 +1,148 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Optional, Tuple
 import asyncio
-from langchain_groq import ChatGroq
+import hashlib
+import os
+import re
+import time
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph
+from cache import dedupe_results
+from clients import GROQ_MODEL, get_chat_model
+from checkpoint import RUNS_DIR, get_checkpointer
+from instrumentation import traced_node
+from context import build_context, research_budget
+from store import get_research_store
 
 # Import the ReportState model
 from models import ReportState
 
 # Import research functionality
-from research import Researcher
+from research import AsyncResearcher, research_outline_item, stream_research, targeted_search
+from quality import QUALITY_GATE, QUALITY_EXTRA_SEARCHES, score_research, describe_score, result_domains
 
-# Initialize LLM model for content generation
-llm1 = ChatGroq(model="deepseek-r1-distill-llama-70b", reasoning_format="hidden")
+# Draft generation mode: "single" writes the whole paper in one LLM call,
+# "sections" drafts every outline section concurrently and stitches them together
+DRAFT_MODE = os.getenv("DRAFT_MODE", "single")
+# Maximum number of section drafts in flight at once in "sections" mode
+DRAFT_CONCURRENCY = int(os.getenv("DRAFT_CONCURRENCY", "4"))
+# Upper limits on the research tokens packed into each prompt; 0 fills whatever the model's
+# context window leaves after the rest of the prompt and the reply
+OUTLINE_CONTEXT_TOKENS = int(os.getenv("OUTLINE_CONTEXT_TOKENS", "1000"))
+DRAFT_CONTEXT_TOKENS = int(os.getenv("DRAFT_CONTEXT_TOKENS", "625"))
+# Research limit for each section in "sections" mode
+SECTION_CONTEXT_TOKENS = int(os.getenv("SECTION_CONTEXT_TOKENS", "625"))
+# Tokens of the context window kept free for the reply at each stage
+OUTLINE_OUTPUT_TOKENS = int(os.getenv("OUTLINE_OUTPUT_TOKENS", "2048"))
+DRAFT_OUTPUT_TOKENS = int(os.getenv("DRAFT_OUTPUT_TOKENS", "8192"))
+SECTION_OUTPUT_TOKENS = int(os.getenv("SECTION_OUTPUT_TOKENS", "2048"))
+
+# Set to 0 to finish all research before writing the outline; by default a provisional outline
+# is written from the Tavily results and refined as each browser task's findings arrive
+OVERLAP_OUTLINE = os.getenv("OVERLAP_OUTLINE", "1").lower() in ("1", "true", "yes")
+
+# Set to 1 to stream outline and draft tokens to the console and to files under the run directory
+STREAM_OUTPUT = os.getenv("STREAM_OUTPUT", "").lower() in ("1", "true", "yes")
+
+def config_run_id(config: Optional[RunnableConfig]) -> Optional[str]:
+    """Id of the stored run a node is executing in, or None outside a stored run"""
+    return ((config or {}).get("configurable") or {}).get("thread_id")
+
+def stream_path(config: Optional[RunnableConfig], filename: str) -> Optional[str]:
+    """Path of a streamed output file inside the run's directory, or None outside a stored run"""
+    run_id = config_run_id(config)
+    if run_id is None:
+        return None
+    run_dir = os.path.join(RUNS_DIR, run_id)
+    os.makedirs(run_dir, exist_ok=True)
+    return os.path.join(run_dir, filename)
+
+async def generate_text(prompt: str, label: str, path: Optional[str] = None, echo: bool = True,
+                        fresh: bool = False) -> str:
+    """Run prompt through the cached chat model and return the response text.
+
+    A fresh call skips the cached response but stores the new one, so later runs reuse it.
+
+    With STREAM_OUTPUT on, tokens are written to path as they arrive (and echoed to
+    stdout), so a call that dies still leaves its partial output on disk. The time
+    to first token is reported for every streamed call.
+    """
+    llm1 = get_chat_model().bypassing() if fresh else get_chat_model()
+    if not STREAM_OUTPUT:
+        result = await llm1.ainvoke(prompt)
+        return result.content if hasattr(result, 'content') else str(result)
+    
+    start = time.perf_counter()
+    first_token_seconds = None
+    parts = []
+    output = open(path, "w", encoding="utf-8") if path else None
+    try:
+        async for chunk in llm1.astream(prompt):
+            text = chunk.content if isinstance(chunk.content, str) else ""
+            if not text:
+                continue
+            if first_token_seconds is None:
+                first_token_seconds = time.perf_counter() - start
+            parts.append(text)
+            if output:
+                output.write(text)
+                output.flush()
+            if echo:
+                print(text, end="", flush=True)
+    finally:
+        if output:
+            output.close()
+    if echo:
+        print()
+    first_token_text = f"{first_token_seconds:.2f}s" if first_token_seconds is not None else "n/a"
+    print(f"[{label}] time to first token: {first_token_text}, total: {time.perf_counter() - start:.2f}s")
+    return "".join(parts)
+
+def collect_sources(results: List[Dict[str, Any]]) -> List[str]:
+    """The real pages behind research results, including those a browser answer drew on"""
+    sources = []
+    for result in results:
+        for url in [result.get("url", "")] + result.get("urls", []):
+            if "://" in url and url not in sources:
+                sources.append(url)
+    return sources
 
 # Research function for the graph
-def research_topic(state: ReportState) -> ReportState:
+async def research_topic(state: ReportState, config: Optional[RunnableConfig] = None) -> ReportState:
     """Perform initial research on the topic using Tavily and browser search"""
-    search_results = Researcher(f"{state['topic']}")
-    # Extract URLs from search results for sources
-    sources = []
-    for result in search_results:
-        if 'url' in result:
-            sources.append(result['url'])
+    search_results = await AsyncResearcher(f"{state['topic']}")
+    sources = collect_sources(search_results)
+    
+    # Keep the text in the research store; the state only carries content ids
+    research_results = get_research_store().store_results(search_results, config_run_id(config) or "")
     
     return {
-        "system_prompt": state["system_prompt"],
-        "topic": state["topic"],
-        "outline": state["outline"],
-        "draft": state["draft"],
         "sources": sources,
-        "intermediate_steps": state["intermediate_steps"] + ["Completed initial research"],
-        "research_results": search_results,
-        "score": state["score"]
+        "intermediate_steps": ["Completed initial research"],
+        "research_results": research_results,
     }
 
 # Generate outline function for the graph
-def generate_outline(state: ReportState) -> ReportState:
+async def generate_outline(state: ReportState, config: Optional[RunnableConfig] = None) -> ReportState:
     """Generate an outline for the research paper based on research results"""
-    # Prepare the research content for the LLM, but limit the size
-    research_content = ""
-    total_chars = 0
-    char_limit = 4000  
-    
-    # First prioritize results with outline_item tags (from browser search)
-    prioritized_results = []
-    other_results = []
-    
-    for result in state["research_results"]:
-        if 'content' in result:
-            if 'outline_item' in result:
-                prioritized_results.append(result)
-            else:
-                other_results.append(result)
-    
-    # Add prioritized results first
-    for result in prioritized_results:
-        content = result['content']
-        # Truncate very long content entries
-        if len(content) > 1000:
-            content = content[:1000] + "... [content truncated]"
-        
-        if total_chars + len(content) < char_limit:
-            research_content += content + "\n\n"
-            total_chars += len(content) + 2
-        else:
-            break
-    
-    # Then add other results if there's still room
-    for result in other_results:
-        content = result['content']
-        # Truncate very long content entries
-        if len(content) > 500:
-            content = content[:500] + "... [content truncated]"
-            
-        if total_chars + len(content) < char_limit:
-            research_content += content + "\n\n"
-            total_chars += len(content) + 2
-        else:
-            break
+    # Pack the research most relevant to the topic into the outline budget
+    research = get_research_store().load_results(state["research_results"])
+    budget = research_budget(outline_prompt(state["topic"], ""), GROQ_MODEL, OUTLINE_OUTPUT_TOKENS,
+                             OUTLINE_CONTEXT_TOKENS)
+    research_content = build_context(research, state["topic"], budget)
+    
+    # Use the LLM to generate the outline
+    outline = await generate_text(outline_prompt(state["topic"], research_content), "outline",
+                                  stream_path(config, "outline.md"))
     
-    # Create a prompt for the LLM to generate an outline
-    outline_prompt = f"""
-    Based on the following research about "{state['topic']}", create a detailed outline for a research paper.
+    return {
+        "outline": outline,
+        "intermediate_steps": ["Generated outline"],
+    }
+
+def outline_prompt(topic: str, research_content: str) -> str:
+    """Prompt asking for a paper outline from scratch"""
+    return f"""
+    Based on the following research about "{topic}", create a detailed outline for a research paper.
     The outline should include:
     1. Introduction
     2. Main sections with key points
@@ -91,69 +153,118 @@ def generate_outline(state: ReportState) -> ReportState:
     
     Generate a well-structured outline:
     """
+
+async def revise_outline(topic: str, outline: str, new_results: List[Dict[str, Any]], revision: int,
+                         config: Optional[RunnableConfig] = None) -> str:
+    """Write a first outline, or fold newly arrived research into the current one.
+
+    A revision only sends the current outline and the new findings, so it is
+    cheaper than writing the outline again from all the research.
+    """
+    def prompt_for(research_content: str) -> str:
+        return revision_prompt(topic, outline, research_content) if outline else outline_prompt(topic, research_content)
     
-    # Use the LLM to generate the outline
-    outline_result = llm1.invoke(outline_prompt)
-    outline = outline_result.content if hasattr(outline_result, 'content') else str(outline_result)
+    budget = research_budget(prompt_for(""), GROQ_MODEL, OUTLINE_OUTPUT_TOKENS, OUTLINE_CONTEXT_TOKENS)
+    prompt = prompt_for(build_context(new_results, topic, budget))
+    label = "outline" if not outline else f"outline revision {revision}"
+    # Each version overwrites outline.md, so the file always holds the latest outline. The first
+    # version is streamed to the console as well; revisions are only shown once the outline is final
+    return await generate_text(prompt, label, stream_path(config, "outline.md"), echo=not outline)
+
+def revision_prompt(topic: str, outline: str, research_content: str) -> str:
+    """Prompt asking to fold new research into an existing outline"""
+    return f"""
+    You are refining the outline of a research paper on "{topic}".
+    
+    Current outline:
+    {outline}
+    
+    New research information:
+    {research_content}
+    
+    Revise the outline so it reflects the new research: add, merge or reorder sections and key points
+    where the new information calls for it, and keep everything that is still supported.
+    Return only the complete revised outline.
+    """
+
+# Research and outline in one node, overlapping the outline with the browser research
+async def research_and_outline(state: ReportState, config: Optional[RunnableConfig] = None) -> ReportState:
+    """Research the topic and write the outline while the research is still arriving.
+
+    The first outline is written from the Tavily results while the browser tasks
+    run. Whenever an outline call finishes, everything that arrived meanwhile is
+    folded in with one revision, and the node returns once the outline reflects
+    all of the research.
+    """
+    topic = state["topic"]
+    results: List[Dict[str, Any]] = []
+    unseen: List[Dict[str, Any]] = []
+    outline = ""
+    revisions = 0
+    revision: Optional[asyncio.Task] = None
+    
+    stream = stream_research(topic)
+    next_batch: Optional[asyncio.Future] = asyncio.ensure_future(anext(stream))
+    try:
+        while next_batch is not None or revision is not None:
+            done, _ = await asyncio.wait([task for task in (next_batch, revision) if task is not None],
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if next_batch in done:
+                try:
+                    batch = next_batch.result()
+                except StopAsyncIteration:
+                    next_batch = None
+                else:
+                    # Only results not already seen (by URL or content) are new to the outline
+                    merged = dedupe_results(results + batch)
+                    unseen.extend(merged[len(results):])
+                    results = merged
+                    next_batch = asyncio.ensure_future(anext(stream))
+            if revision in done:
+                outline = revision.result()
+                revision = None
+            if revision is None and unseen:
+                revisions += 1
+                revision = asyncio.create_task(revise_outline(topic, outline, unseen, revisions, config))
+                unseen = []
+    finally:
+        # The stream can only be closed once the task reading from it has stopped
+        unfinished = [task for task in (next_batch, revision) if task is not None]
+        for task in unfinished:
+            task.cancel()
+        await asyncio.gather(*unfinished, return_exceptions=True)
+        await stream.aclose()
+    
+    # Never write a paper without any grounding
+    if not results:
+        raise RuntimeError(f"No research results for {topic!r}: Tavily and every browser task failed")
+    # A single streamed version is already on the console
+    if revisions > 1 or not STREAM_OUTPUT:
+        print(f"\nOutline ({revisions} version(s)):\n{outline}")
     
     return {
-        "system_prompt": state["system_prompt"],
-        "topic": state["topic"],
+        "sources": collect_sources(results),
         "outline": outline,
-        "draft": state["draft"],
-        "sources": state["sources"],
-        "intermediate_steps": state["intermediate_steps"] + ["Generated outline"],
-        "research_results": state["research_results"],
-        "score": state["score"]
+        "intermediate_steps": ["Completed initial research", "Generated outline"],
+        "research_results": get_research_store().store_results(results, config_run_id(config) or ""),
     }
 
-# Generate draft function for the graph
-def generate_draft(state: ReportState) -> ReportState:
+# Draft the whole paper in a single LLM call
+async def draft_single(state: ReportState, research: List[Dict[str, Any]],
+                       config: Optional[RunnableConfig] = None) -> str:
     """Generate a complete research paper draft based on the outline and research"""
-    # Prepare the research content for the LLM, but limit the size
-    research_content = ""
-    total_chars = 0
-    char_limit = 2500  # limit to stay under token limits
-    
-    # First prioritize results with outline_item tags (from browser search)
-    prioritized_results = []
-    other_results = []
-    
-    for result in state["research_results"]:
-        if 'content' in result:
-            if 'outline_item' in result:
-                prioritized_results.append(result)
-            else:
-                other_results.append(result)
-    
-    # Add prioritized results first
-    for result in prioritized_results:
-        content = result['content']
-        # Truncate very long content entries
-        if len(content) > 500:
-            content = content[:500] + "... [content truncated]"
-        
-        if total_chars + len(content) < char_limit:
-            research_content += content + "\n\n"
-            total_chars += len(content) + 2
-        else:
-            break
-    
-    # Then add other results if there's still room
-    for result in other_results:
-        content = result['content']
-        # Truncate very long content entries
-        if len(content) > 300:
-            content = content[:300] + "... [content truncated]"
-            
-        if total_chars + len(content) < char_limit:
-            research_content += content + "\n\n"
-            total_chars += len(content) + 2
-        else:
-            break
+    # Pack the research most relevant to the outline into what the window leaves after the outline and sources
+    budget = research_budget(draft_prompt(state, ""), GROQ_MODEL, DRAFT_OUTPUT_TOKENS, DRAFT_CONTEXT_TOKENS)
+    research_content = build_context(research, f"{state['topic']}\n{state['outline']}", budget)
     
-    # Create a prompt for the LLM to generate a draft
-    draft_prompt = f"""
+    # Use the LLM to generate the draft
+    draft = await generate_text(draft_prompt(state, research_content), "draft", stream_path(config, "draft.md"))
+    
+    return draft
+
+def draft_prompt(state: ReportState, research_content: str) -> str:
+    """Prompt asking for the whole paper in one reply"""
+    return f"""
     Write a comprehensive research paper on "{state['topic']}" following this outline:
     
     {state['outline']}
@@ -166,38 +277,288 @@ def generate_draft(state: ReportState) -> ReportState:
     
     The paper should be well-structured, informative, and academically sound.
     """
+
+# Split an outline into its top-level sections
+def parse_outline_sections(outline: str) -> List[Dict[str, str]]:
+    """Split the outline into top-level sections, each with a title and its outline text"""
+    lines = outline.split("\n")
     
-    # Use the LLM to generate the draft
-    draft_result = llm1.invoke(draft_prompt)
-    draft = draft_result.content if hasattr(draft_result, 'content') else str(draft_result)
+    # Prefer markdown headings; a single top-level heading is the paper title,
+    # so split on the next heading level in that case
+    headings = []
+    for i, line in enumerate(lines):
+        heading_match = re.match(r'^(#+)\s+(.+)$', line.strip())
+        if heading_match:
+            headings.append((i, len(heading_match.group(1)), heading_match.group(2)))
+    
+    boundaries = []
+    if headings:
+        levels = sorted({level for _, level, _ in headings})
+        split_level = levels[0]
+        if len(levels) > 1 and sum(1 for _, level, _ in headings if level == split_level) == 1:
+            split_level = levels[1]
+        boundaries = [(i, title) for i, level, title in headings if level == split_level]
+    else:
+        # Fall back to unindented numbered or Roman numeral items (e.g. "I. Introduction")
+        for i, line in enumerate(lines):
+            if line[:1].isspace():
+                continue
+            numbered_match = re.match(r'^(?:[IVX]+|\d+)\.\s+(.+)$', line.strip().strip('*').strip())
+            if numbered_match:
+                boundaries.append((i, numbered_match.group(1)))
+    
+    sections = []
+    for n, (start, title) in enumerate(boundaries):
+        end = boundaries[n + 1][0] if n + 1 < len(boundaries) else len(lines)
+        sections.append({
+            "title": title.strip().strip('*').strip(),
+            "outline": "\n".join(lines[start:end]).strip()
+        })
+    return sections
+
+def build_section_prompt(state: ReportState, research: List[Dict[str, Any]], section: Dict[str, str]) -> str:
+    """Complete prompt for one section, with the research most relevant to it"""
+    budget = research_budget(section_prompt(state, section, ""), GROQ_MODEL, SECTION_OUTPUT_TOKENS,
+                             SECTION_CONTEXT_TOKENS)
+    research_content = build_context(research, f"{state['topic']}\n{section['outline']}", budget)
+    return section_prompt(state, section, research_content)
+
+def prompt_fingerprint(prompt: str) -> str:
+    """Hash of a section prompt, which holds everything the section's draft depends on"""
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+async def draft_section(prompt: str, section: Dict[str, str], semaphore: asyncio.Semaphore, index: int = 0,
+                        config: Optional[RunnableConfig] = None, fresh: bool = False) -> str:
+    """Draft a single section of the paper from its prompt; fresh skips the cached response to get a new version"""
+    async with semaphore:
+        print(f"Drafting section: {section['title']}")
+        # Concurrent sections would interleave on the console, so they only stream to their files
+        text = await generate_text(prompt, f"section {index + 1}",
+                                   stream_path(config, f"draft_section_{index + 1}.md"), echo=False, fresh=fresh)
+    text = text.strip()
+    if not text.startswith("#"):
+        text = f"## {section['title']}\n\n{text}"
+    return text
+
+def section_prompt(state: ReportState, section: Dict[str, str], research_content: str) -> str:
+    """Prompt asking for one section of the paper"""
+    return f"""
+    You are writing one section of a research paper on "{state['topic']}".
+    The full outline of the paper is:
+    
+    {state['outline']}
+    
+    Write only the section "{section['title']}", following this part of the outline:
+    
+    {section['outline']}
+    
+    Use the following research information:
+    {research_content}
+    
+    Include proper citations to these sources where relevant:
+    {', '.join(state['sources'][:5])}
+    
+    Start with the markdown heading "## {section['title']}" and do not write any other section.
+    The section should be informative and academically sound.
+    """
+
+def stitch_sections(topic: str, section_drafts: List[str]) -> str:
+    """Assemble the section drafts, in outline order, into a single paper"""
+    return f"# {topic}\n\n" + "\n\n".join(section_drafts)
+
+# Draft outline sections concurrently, reusing earlier drafts whose inputs are unchanged, then stitch them together
+async def draft_sections(state: ReportState, research: List[Dict[str, Any]], sections: List[Dict[str, str]],
+                         config: Optional[RunnableConfig] = None, redo: Iterable[int] = ()
+                         ) -> Tuple[str, List[Dict[str, str]], List[int]]:
+    """Generate the draft section by section with at most DRAFT_CONCURRENCY calls in flight.
+
+    A section is only drafted when no stored section (state["sections"]) was
+    written from the same prompt, or when its index is in redo. Returns the
+    draft, the section records to store and the indices that were drafted.
+    """
+    previous = {record["fingerprint"]: record for record in state.get("sections") or []}
+    redo = set(redo)
+    semaphore = asyncio.Semaphore(max(1, DRAFT_CONCURRENCY))
+    records: List[Optional[Dict[str, str]]] = []
+    pending = {}
+    for i, section in enumerate(sections):
+        prompt = build_section_prompt(state, research, section)
+        fingerprint = prompt_fingerprint(prompt)
+        if i not in redo and fingerprint in previous:
+            records.append(previous[fingerprint])
+        else:
+            records.append(None)
+            pending[i] = (fingerprint, draft_section(prompt, section, semaphore, i, config, fresh=i in redo))
+    # gather returns results in task order, so the draft keeps the outline order
+    texts = await asyncio.gather(*(task for _, task in pending.values()))
+    for (i, (fingerprint, _)), text in zip(pending.items(), texts):
+        records[i] = {"title": sections[i]["title"], "fingerprint": fingerprint, "text": text}
+    draft = stitch_sections(state["topic"], [record["text"] for record in records])
+    path = stream_path(config, "draft.md") if STREAM_OUTPUT else None
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(draft)
+    return draft, records, list(pending)
+
+# Generate draft function for the graph
+async def generate_draft(state: ReportState, config: Optional[RunnableConfig] = None) -> ReportState:
+    """Generate a complete research paper draft based on the outline and research"""
+    # Read the research text once for every prompt of this node
+    research = get_research_store().load_results(state["research_results"])
+    sections = parse_outline_sections(state["outline"]) if DRAFT_MODE == "sections" else []
+    section_records = []
+    if sections:
+        draft, section_records, _ = await draft_sections(state, research, sections, config)
+    else:
+        draft = await draft_single(state, research, config)
     
     return {
-        "system_prompt": state["system_prompt"],
-        "topic": state["topic"],
-        "outline": state["outline"],
         "draft": draft,
+        "sections": section_records,
+        "intermediate_steps": ["Generated draft"],
+    }
+
+async def regenerate_draft(state: ReportState, redo: Iterable[int] = (), research_items: Iterable[str] = (),
+                           config: Optional[RunnableConfig] = None) -> Tuple[ReportState, List[str]]:
+    """Redraft only the sections whose inputs changed, plus the sections in redo.
+
+    Fresh research is first gathered for each of research_items and added to the
+    run's research; a section is then redrafted when its prompt (outline, sources
+    and the research chosen for it) differs from the one its stored draft was
+    written from. A run drafted in one piece has no stored sections, so every
+    section is drafted once. Returns the state update and the titles redrafted.
+    """
+    run_id = config_run_id(config) or ""
+    store = get_research_store()
+    research_results = state["research_results"]
+    research = store.load_results(research_results)
+    for item in research_items:
+        new_results = await research_outline_item(state["topic"], item)
+        # Keep only findings the run does not have yet
+        merged = dedupe_results(research + new_results)
+        added = merged[len(research):]
+        print(f"New research for {item!r}: {len(added)} result(s)")
+        research_results = research_results + store.store_results(added, run_id)
+        research = merged
+    state = {**state, "research_results": research_results, "sources": collect_sources(research)}
+    
+    sections = parse_outline_sections(state["outline"])
+    if not sections:
+        raise ValueError("The outline has no sections to regenerate")
+    draft, section_records, redrafted = await draft_sections(state, research, sections, config, redo)
+    titles = [sections[i]["title"] for i in redrafted]
+    update = {
+        "draft": draft,
+        "sections": section_records,
         "sources": state["sources"],
-        "intermediate_steps": state["intermediate_steps"] + ["Generated draft"],
-        "research_results": state["research_results"],
-        "score": state["score"]
+        "research_results": research_results,
+        "intermediate_steps": [f"Regenerated {len(titles)} of {len(sections)} sections"],
+    }
+    return update, titles
+
+# Score the research cheaply after each stage, so weak research gets a targeted extra search
+def record_score(state: ReportState, entry: Dict[str, Any], searches: List[str]) -> ReportState:
+    """State update appending a score entry, with the searches to run if it is weak"""
+    entry = {**entry, "searches": searches[:QUALITY_EXTRA_SEARCHES] if entry["verdict"] == "weak" else []}
+    print(describe_score(entry))
+    return {
+        "score": list(state.get("score") or []) + [entry],
+        "intermediate_steps": [describe_score(entry)],
+    }
+
+async def score_research_stage(state: ReportState, config: Optional[RunnableConfig] = None) -> ReportState:
+    """Score the research against the topic"""
+    research = get_research_store().load_results(state["research_results"])
+    entry = await asyncio.to_thread(score_research, research, [state["topic"]], "research")
+    return record_score(state, entry, [state["topic"]])
+
+async def score_outline_stage(state: ReportState, config: Optional[RunnableConfig] = None) -> ReportState:
+    """Score the research against every section of the outline; uncovered sections are searched for"""
+    research = get_research_store().load_results(state["research_results"])
+    sections = parse_outline_sections(state["outline"]) or [{"title": state["topic"], "outline": state["topic"]}]
+    queries = [f"{section['title']}\n{section['outline']}" for section in sections]
+    entry = await asyncio.to_thread(score_research, research, queries, "outline")
+    # With every section covered, weak research lacks sites rather than content, so the topic is searched again
+    searches = [f"{state['topic']} {sections[i]['title']}" for i in entry["gaps"]] or [state["topic"]]
+    return record_score(state, entry, searches)
+
+def route_on_score(state: ReportState) -> str:
+    """Route weak research with gaps to the extra search and everything else onwards"""
+    entry = (state.get("score") or [{}])[-1]
+    return "weak" if entry.get("searches") else "pass"
+
+def scored_stage(state: ReportState) -> str:
+    """Stage of the latest score, which decides where the workflow goes after the extra search"""
+    return state["score"][-1]["stage"]
+
+async def research_gaps(state: ReportState, config: Optional[RunnableConfig] = None) -> ReportState:
+    """Run the targeted searches of the latest weak score and add what they find to the research.
+
+    With too few distinct sites the sites already used are excluded from the
+    searches. This runs at most once per stage, so weak research costs a few
+    Tavily calls rather than another round of browser tasks.
+    """
+    entry = state["score"][-1]
+    store = get_research_store()
+    research = store.load_results(state["research_results"])
+    exclude = result_domains(research) if entry["diversity"] < 1 else None
+    found = await asyncio.gather(*(targeted_search(query, exclude) for query in entry["searches"]))
+    # Keep only findings the run does not have yet
+    merged = dedupe_results(research + [result for results in found for result in results])
+    added = merged[len(research):]
+    print(f"Targeted search for {len(entry['searches'])} gap(s) found {len(added)} new result(s)")
+    
+    return {
+        "sources": collect_sources(merged),
+        "research_results": state["research_results"] + store.store_results(added, config_run_id(config) or ""),
+        "intermediate_steps": [f"Searched {len(entry['searches'])} research gap(s)"],
     }
 
 # Create the research paper workflow graph
-def create_research_paper_workflow():
+def create_research_paper_workflow(checkpointer=None):
+    """Build and compile the workflow graph.
+
+    Every node's output is checkpointed (to the on-disk run store unless another
+    checkpointer is given), so runs must be invoked with a run_config(run_id).
+    """
     # Initialize the graph
     workflow = StateGraph(ReportState)
     
     # Add nodes - rename to avoid conflict with state keys
-    workflow.add_node("research_node", research_topic)
-    workflow.add_node("outline_node", generate_outline)
-    workflow.add_node("draft_node", generate_draft)
+    workflow.add_node("draft_node", traced_node("draft_node", generate_draft))
+    if OVERLAP_OUTLINE:
+        workflow.add_node("research_outline_node", traced_node("research_outline_node", research_and_outline))
+        workflow.set_entry_point("research_outline_node")
+        outline_node = "research_outline_node"
+    else:
+        workflow.add_node("research_node", traced_node("research_node", research_topic))
+        workflow.add_node("outline_node", traced_node("outline_node", generate_outline))
+        
+        # Add edges
+        workflow.set_entry_point("research_node")
+        outline_node = "outline_node"
     
-    # Add edges
-    workflow.set_entry_point("research_node")
-    workflow.add_edge("research_node", "outline_node")
-    workflow.add_edge("outline_node", "draft_node")
+    if not QUALITY_GATE:
+        if not OVERLAP_OUTLINE:
+            workflow.add_edge("research_node", "outline_node")
+        workflow.add_edge(outline_node, "draft_node")
+    else:
+        # Each scoring node either passes on or sends weak research through one round of targeted searches
+        workflow.add_node("score_outline_node", traced_node("score_outline_node", score_outline_stage))
+        workflow.add_node("research_gaps_node", traced_node("research_gaps_node", research_gaps))
+        workflow.add_edge(outline_node, "score_outline_node")
+        workflow.add_conditional_edges("score_outline_node", route_on_score,
+                                       {"weak": "research_gaps_node", "pass": "draft_node"})
+        after_gaps = {"outline": "draft_node"}
+        if not OVERLAP_OUTLINE:
+            workflow.add_node("score_research_node", traced_node("score_research_node", score_research_stage))
+            workflow.add_edge("research_node", "score_research_node")
+            workflow.add_conditional_edges("score_research_node", route_on_score,
+                                           {"weak": "research_gaps_node", "pass": "outline_node"})
+            after_gaps["research"] = "outline_node"
+        workflow.add_conditional_edges("research_gaps_node", scored_stage, after_gaps)
     
     # Set the final node
     workflow.set_finish_point("draft_node")
     
-    return workflow.compile()
\ No newline at end of file
+    return workflow.compile(checkpointer=checkpointer if checkpointer is not None else get_checkpointer())
\ No newline at end of file